@@ -1,16 +1,20 @@
-import random
-import math
+import os
+import numpy as np
 from environment import Agent, Environment
 from planner import RoutePlanner
 from simulator import Simulator
-import operator
+from qtable import QTable
+from schedules import epsilon_decays, alpha_decays
+from logger import get_logger
+
+log = get_logger("agent")
 
 
 class LearningAgent(Agent):
     """ An agent that learns to drive in the Smartcab world.
         This is the object you will be modifying. """ 
 
-    def __init__(self, env, learning=False, epsilon=1.0, alpha=0.5, edecay=None, adecay=None):
+    def __init__(self, env, learning=False, epsilon=1.0, alpha=0.5, edecay=None, adecay=None, qtable=None):
         """
         
         :param env:
@@ -50,7 +54,14 @@ class LearningAgent(Agent):
                           by that percentage.
                 - "cr99.5" same as above, but the alpha decay is capped to a
                            minumum value of 0.001.
-        
+
+        Decay specs are compiled once here (see schedules.py); an unknown or
+        malformed spec raises a ValueError. Custom schedules can be added with
+        epsilon_decays.register() / alpha_decays.register().
+
+        :param qtable: Another agent's Q-table (its 'Q') to learn into, so that
+            several agents driving in the same environment share what they
+            learn. By default the agent has a Q-table of its own.
         """
         super(LearningAgent, self).__init__(env)     # Set the agent in the evironment 
         self.planner = RoutePlanner(self.env, self)  # Create a route planner
@@ -58,15 +69,23 @@ class LearningAgent(Agent):
 
         # Set parameters of the learning agent
         self.learning = learning # Whether the agent is expected to learn
-        self.Q = dict()          # Create a Q-table which will be a dictionary of tuples
         self.epsilon = epsilon   # Random exploration factor
         self.epsilon_init = epsilon
         self.alpha = alpha       # Learning factor
 
         self.train_iteration = 0
         self.init_qval = 0.0  # initial Q values
+
+        # Create a dense Q-table over every (light, oncoming, left, waypoint) state, unless sharing one
+        if qtable is not None:
+            self.Q = qtable
+        else:
+            self.Q = QTable([['green', 'red'], self.valid_actions, self.valid_actions, self.valid_actions],
+                            self.valid_actions, self.init_qval)
         self.edecay =  edecay
         self.adecay = adecay
+        self.epsilon_schedule = epsilon_decays.compile(edecay)
+        self.alpha_schedule = alpha_decays.compile(adecay)
         self.t = 0
         
 
@@ -89,58 +108,12 @@ class LearningAgent(Agent):
             self.alpha = 0
         else:
             # ALPHA DECAY
-            if type(self.adecay)is float:
-                self.alpha -= self.adecay  # linear decay rate for alpha
-            elif self.adecay == "1/t":
-                self.alpha = 1.0 / (self.t)
-            elif self.adecay == "1/t2":
-                self.alpha = 1.0 / (self.t ** 2)
-            elif self.adecay == "1/logt":
-                self.alpha = 1.0/math.log((self.t + math.e - 1))
-            elif self.adecay == "half":
-                self.alpha = self.alpha/2.0
-            elif type(self.adecay) is str and self.adecay.startswith("r"):
-                r = float(self.adecay[1:]) / 100.
-                self.alpha = r*self.alpha
-            elif type(self.adecay) is str and self.adecay.startswith("cr"):
-                # Capped rate (capped to a min alpha val of 0.005)
-                r = float(self.adecay[2:]) / 100.
-                self.alpha = max(r*self.alpha, 0.001)
+            if self.alpha_schedule is not None:
+                self.alpha = self.alpha_schedule(self.alpha, self.t, self.alpha)
 
             # EPSILON DECAY
-            if type(self.edecay) is float:
-                self.epsilon -= self.edecay # linear decay rate for epsilon
-            elif self.edecay == "a^t":
-                self.epsilon = self.alpha**self.t
-            elif self.edecay == "a":
-                self.epsilon = self.alpha
-            elif self.edecay == "a2":
-                self.epsilon = self.alpha**2
-            elif self.edecay == "1/t2":
-                self.epsilon = 1.0/ (self.t**2)
-            elif self.edecay == "1/t":
-                self.epsilon = 1.0 / (self.t)
-            elif self.edecay == "eat":
-                self.epsilon = math.e ** (-self.alpha * self.t)
-            elif type(self.edecay) is str and self.edecay.startswith("ert"):
-                r = float(self.edecay[3:])
-                self.epsilon = math.e ** (-r * self.t)
-            elif self.edecay == "et":
-                self.epsilon = math.e ** (-self.t)
-            elif self.edecay == "cat":
-                self.epsilon = math.cos(self.alpha * self.t)
-            elif type(self.edecay) is str and self.edecay.startswith("r"):
-                r = float(self.edecay[1:]) / 100.
-                self.epsilon = r*self.epsilon
-            elif type(self.edecay) is str and self.edecay.startswith("inv_sigmoida"):
-                #s = "inv_sigmoid_k2.6o60"
-                k, offset = [float(val) for val in self.edecay.split("k")[1].split("o")]
-                # self.trial_count = self.trial_count + 1
-                self.epsilon = 1 - (1 / (1 + math.exp(-k * self.alpha * (self.t - offset))))
-            elif type(self.edecay) is str and self.edecay.startswith("inv_sigmoid"):
-                k, offset = [float(val) for val in self.edecay.split("k")[1].split("o")]
-                # self.trial_count = self.trial_count + 1
-                self.epsilon = 1 - (1 / (1 + math.exp(-k * (self.t - offset))))
+            if self.epsilon_schedule is not None:
+                self.epsilon = self.epsilon_schedule(self.epsilon, self.t, self.alpha)
         return None
 
 
@@ -152,6 +125,7 @@ class LearningAgent(Agent):
         # Collect data about the environment
         waypoint = self.planner.next_waypoint() # The next waypoint 
         inputs = self.env.sense(self)           # Visual input - intersection light and traffic
+        self.inputs = inputs                    # Passed on to act() so it doesn't sense again
         deadline = self.env.get_deadline(self)  # Remaining deadline
 
         input_keys = ['light', 'oncoming', 'left']
@@ -165,11 +139,10 @@ class LearningAgent(Agent):
             maximum Q-value of all actions based on the 'state' the smartcab is in. """
 
         if state in self.Q:
-            Q_vals = self.Q[state]
-            maxQ = max(Q_vals.iteritems(), key=operator.itemgetter(1))[1]
+            maxQ = self.Q.max(state)
         else:
             # Handle the case where state is not in self.Q
-            maxQ = random.choice(self.valid_actions)
+            maxQ = self.random.choice(self.valid_actions)
     
         return maxQ
 
@@ -178,11 +151,9 @@ class LearningAgent(Agent):
         """ The createQ function is called when a state is generated by the agent. """
 
         # When learning, check if the 'state' is not in the Q-table
-        # If it is not, create a new dictionary for that state
-        #   Then, for each action available, set the initial Q-value to 0.0
+        # If it is not, add it with the initial Q-value for every action
         if self.learning and state not in self.Q:
-            self.Q[state] = {action: self.init_qval for action in
-                                  self.valid_actions}
+            self.Q.create(state)
         
         return None
 
@@ -201,21 +172,18 @@ class LearningAgent(Agent):
         if self.learning:
             # With a probability of epsilon, chose an action at random
             # (but only if it is in the learning phase)
-            if (random.random() < self.epsilon):
-                action = random.choice(self.valid_actions)
+            if (self.random.random() < self.epsilon):
+                action = self.random.choice(self.valid_actions)
 
             # Otherwise select the action that has the highest expected value..
             else:
                 # Chose the action with the  highest Q value. For multiple
                 # actions with equally high Q values, select one at random
-                Q_vals = self.Q[state]
-                maxval = max(Q_vals.iteritems(), key=operator.itemgetter(1))[1]
-                maxacts = [act for act in Q_vals if Q_vals[act] == maxval]
-                action = random.choice(maxacts)
+                action = self.random.choice(self.Q.best_actions(state))
 
         else:
             # When not learning, choose a random action
-            action = random.choice(self.valid_actions)
+            action = self.random.choice(self.valid_actions)
 
         return action
 
@@ -228,14 +196,43 @@ class LearningAgent(Agent):
         # When learning, implement the value iteration update rule
         #   Use only the learning rate 'alpha' (do not use the discount factor 'gamma')
         if self.learning:
-            Qval = self.Q[state][action]
+            Qval = self.Q.get(state, action)
             Qval += self.alpha * (reward - Qval) # Without considering future rewards
-            self.Q[state][action] = Qval
-        print("ALPHA: {}  EPSILON: {}".format(self.alpha, self.epsilon))
-        print("ADECAY: {}  EDECAY: {}".format(self.adecay, self.edecay))
+            self.Q.set(state, action, Qval)
+        log.debug("ALPHA: %s  EPSILON: %s", self.alpha, self.epsilon)
+        log.debug("ADECAY: %s  EDECAY: %s", self.adecay, self.edecay)
         return
 
 
+    def save_checkpoint(self, filename, **extra):
+        """ Save the Q-table along with epsilon, alpha and the trial count 't'
+            to 'filename' in compressed .npz format. Any 'extra' values (eg.
+            simulator trial counters) are stored alongside. The file is
+            replaced atomically, so a crash never leaves a partial checkpoint. """
+
+        tmp_filename = filename + ".tmp"
+        with open(tmp_filename, 'wb') as f:
+            np.savez_compressed(f, q_values=self.Q.values, q_created=self.Q.created,
+                                epsilon=self.epsilon, alpha=self.alpha, t=self.t, **extra)
+        os.rename(tmp_filename, filename)
+
+    def load_checkpoint(self, filename):
+        """ Restore the Q-table, epsilon, alpha and 't' saved by save_checkpoint().
+            Returns the checkpoint's extra values as a dictionary. """
+
+        with np.load(filename) as data:
+            if data['q_values'].shape != self.Q.values.shape:
+                raise ValueError("Checkpoint {} has a Q-table of shape {}, expected {}".format(
+                    filename, data['q_values'].shape, self.Q.values.shape))
+            self.Q.values[:] = data['q_values']
+            self.Q.created[:] = data['q_created']
+            self.epsilon = float(data['epsilon'])
+            self.alpha = float(data['alpha'])
+            self.t = int(data['t'])
+            return {key: data[key].item() for key in data.files
+                    if key not in ('q_values', 'q_created', 'epsilon', 'alpha', 't')}
+
+
     def update(self):
         """ The update function is called when a time step is completed in the 
             environment for a given trial. This function will build the agent
@@ -244,7 +241,7 @@ class LearningAgent(Agent):
         state = self.build_state()          # Get current state
         self.createQ(state)                 # Create 'state' in Q-table
         action = self.choose_action(state)  # Choose an action
-        reward = self.env.act(self, action) # Receive a reward
+        reward = self.env.act(self, action, self.inputs) # Receive a reward
         self.learn(state, action, reward)   # Q-learn
 
         return
@@ -260,6 +257,8 @@ def run():
     #   verbose     - set to True to display additional output from the simulation
     #   num_dummies - discrete number of dummy agents in the environment, default is 100
     #   grid_size   - discrete number of intersections (columns, rows), default is (8, 6)
+    #   lod_radius  - only simulate dummies this many intersections around the driving agent,
+    #                 for large grids, default is None (simulate every dummy)
     env = Environment(num_dummies=100, grid_size=[8,6])
     
     ##############
@@ -278,6 +277,13 @@ def run():
     #   enforce_deadline - set to True to enforce a deadline metric
     env.set_primary_agent(agent, enforce_deadline=True)
 
+    ##############
+    # Optionally add more learning cabs, each driving trips of its own
+    # Flags:
+    #   qtable - pass agent.Q to learn into the driving agent's Q-table, default is a Q-table of its own
+    # for i in xrange(3):
+    #     env.add_learner(env.create_agent(LearningAgent, learning=True, epsilon=1.0, alpha=0.15, edecay="inv_sigmoid_k0.03o100", qtable=agent.Q))
+
     ##############
     # Create the simulation
     # Flags:
@@ -285,13 +291,21 @@ def run():
     #   display      - set to False to disable the GUI if PyGame is enabled
     #   log_metrics  - set to True to log trial and simulation results to /logs
     #   optimized    - set to True to change the default log file name
-    sim = Simulator(env, display=False, update_delay=0.00001, log_metrics=True, optimized=True)
+    #   headless     - set to True to step as fast as possible with no GUI or wall-clock delay
+    #   log_level    - diagnostics to print to the terminal (eg "INFO", "DEBUG"), default is None (silent)
+    #   log_format   - "csv" (default) or "npy" for a binary trial log
+    #   profile      - set to True to time each phase of a step and report it after the run
+    #   fps          - cap the GUI at this many frames per second, redrawing only what changed,
+    #                  while the environment steps every update_delay regardless, default is None
+    sim = Simulator(env, display=False, update_delay=0.00001, log_metrics=True, optimized=True, headless=True)
     
     ##############
     # Run the simulator
     # Flags:
     #   tolerance  - epsilon tolerance before beginning testing, default is 0.05 
     #   n_test     - discrete number of testing trials to perform, default is 0
+    #   checkpoint_every - save the Q-table every N training trials, default is None (never)
+    #   resume_from      - checkpoint file to continue training (or go straight to testing) from
     sim.run(n_test=100, tolerance=0.001)
 
 
@@ -0,0 +1,157 @@
+import numpy as np
+from collections import OrderedDict
+from environment import Environment
+
+
+class ArrayTrafficLight(object):
+    """ A traffic light whose state lives in the arrays of an ArrayEnvironment.
+        Exposes the same attributes as TrafficLight so that sense() and the
+        renderer can keep reading 'state'. """
+
+    __slots__ = ('env', 'index')
+
+    def __init__(self, env, index):
+        self.env = env
+        self.index = index
+
+    @property
+    def state(self):
+        return bool(self.env.light_state[self.index])
+
+    @property
+    def period(self):
+        return int(self.env.light_period[self.index])
+
+    @property
+    def last_updated(self):
+        return int(self.env.light_last_updated[self.index])
+
+    def reset(self):
+        self.env.light_last_updated[self.index] = 0
+
+    def update(self, t):
+        if t - self.env.light_last_updated[self.index] >= self.env.light_period[self.index]:
+            self.env.light_state[self.index] = not self.env.light_state[self.index]
+            self.env.light_last_updated[self.index] = t
+
+
+class ArrayEnvironment(Environment):
+    """ Environment that stores dummy traffic and traffic lights in NumPy arrays
+        (struct-of-arrays) and advances every dummy in a single batched update.
+
+        Agents added with create_agent(), such as the primary agent, keep using
+        the regular sense/act API through agent_states. Dummies only exist as
+        array entries: like Environment's dummies, they all sense the same
+        snapshot of their intersection and move together.
+        They are not drawn by Simulator.render(). """
+
+    # Change in heading index for each waypoint index (valid_headings is E, N, W, S)
+    # None and 'forward' keep the heading, 'left' turns to the next heading, 'right' to the previous
+    heading_turns = np.array([0, 0, 1, 3])
+
+    def __init__(self, verbose=False, num_dummies=100, grid_size=(8, 6), seed=None):
+        super(ArrayEnvironment, self).__init__(verbose=verbose, num_dummies=0, grid_size=grid_size, seed=seed)
+        self.num_dummies = num_dummies
+        self.np_random = np.random.RandomState(self.dummy_random.randint(0, 2**32 - 1))
+
+        # Intersections are indexed column-major, matching the order they were created in
+        self.columns = self.bounds[2] - self.bounds[0] + 1
+        self.rows = self.bounds[3] - self.bounds[1] + 1
+        self.headings = np.array(self.valid_headings)
+
+        # Traffic lights
+        lights = self.intersections.values()
+        self.light_state = np.array([light.state for light in lights], dtype=bool)
+        self.light_period = np.array([light.period for light in lights], dtype=np.int32)
+        self.light_last_updated = np.zeros(len(lights), dtype=np.int32)
+        self.intersections = OrderedDict((location, ArrayTrafficLight(self, i)) for i, location in enumerate(self.intersections))
+
+        # Dummy traffic: grid column/row offsets from bounds, heading index and waypoint index
+        self.dummy_x = self.np_random.randint(0, self.columns, num_dummies).astype(np.int32)
+        self.dummy_y = self.np_random.randint(0, self.rows, num_dummies).astype(np.int32)
+        self.dummy_heading = np.full(num_dummies, self.valid_headings.index((0, 1)), dtype=np.int8)
+        self.dummy_waypoint = self.np_random.randint(1, len(self.valid_actions), num_dummies).astype(np.int8)
+
+    def reset(self, testing=False):
+        """ Reset the trial, then scatter the dummies over distinct
+            (intersection, heading) slots. """
+
+        super(ArrayEnvironment, self).reset(testing)
+
+        slots = self.np_random.choice(self.columns * self.rows * 4, self.num_dummies, replace=False)
+        cells, headings = np.divmod(slots, 4)
+        self.dummy_x[:], self.dummy_y[:] = np.divmod(cells, self.rows)
+        self.dummy_heading[:] = headings
+
+    def update_agents(self):
+        """ Update object agents as usual, then advance all dummies at once. """
+
+        super(ArrayEnvironment, self).update_agents()
+        if self.num_dummies == 0:
+            return
+
+        heading = self.dummy_heading.astype(np.intp)
+        waypoint = self.dummy_waypoint.astype(np.intp)
+        cell = self.dummy_x * self.rows + self.dummy_y
+        slot = cell * 4 + heading
+
+        # Summarize the waypoints of the dummies in each (intersection, heading) slot
+        n_slots = self.columns * self.rows * 4
+        occupied = np.bincount(slot, minlength=n_slots) > 0
+        going_forward = np.bincount(slot, weights=(waypoint == 1), minlength=n_slots) > 0
+        going_left = np.bincount(slot, weights=(waypoint == 2), minlength=n_slots) > 0
+
+        # Traffic from the left heads (h + 3) % 4, oncoming traffic heads (h + 2) % 4.
+        # sense() reports oncoming == 'left' over any other waypoint, so the
+        # oncoming lane blocks a left turn only if nobody in it turns left.
+        green = self.light_state[cell] == (heading % 2 == 1)
+        left_forward = going_forward[cell * 4 + (heading + 3) % 4]
+        oncoming_slot = cell * 4 + (heading + 2) % 4
+        oncoming_crossing = occupied[oncoming_slot] & ~going_left[oncoming_slot]
+
+        # Same legality rules as DummyAgent.update()
+        moving = np.where(waypoint == 1, green,
+                 np.where(waypoint == 2, green & ~oncoming_crossing,
+                          green | ~left_forward))
+
+        movers = np.flatnonzero(moving)
+        new_heading = (heading[movers] + self.heading_turns[waypoint[movers]]) % 4
+        self.dummy_x[movers] = (self.dummy_x[movers] + self.headings[new_heading, 0]) % self.columns  # wrap-around
+        self.dummy_y[movers] = (self.dummy_y[movers] + self.headings[new_heading, 1]) % self.rows
+        self.dummy_heading[movers] = new_heading
+        self.dummy_waypoint[movers] = self.np_random.randint(1, len(self.valid_actions), len(movers))
+
+    def update_lights(self):
+        """ Toggle every traffic light whose period has elapsed. """
+
+        toggle = (self.t - self.light_last_updated) >= self.light_period
+        self.light_state ^= toggle
+        self.light_last_updated[toggle] = self.t
+
+    def sense(self, agent):
+        """ Sense object agents as usual, then add the dummies at the
+            agent's intersection using the same precedence rules. """
+
+        inputs = super(ArrayEnvironment, self).sense(agent)
+        if self.num_dummies == 0:
+            return inputs
+
+        state = self.agent_states[agent]
+        x = state.location[0] - self.bounds[0]
+        y = state.location[1] - self.bounds[1]
+        heading = state.heading
+
+        for i in np.flatnonzero((self.dummy_x == x) & (self.dummy_y == y)):
+            relation = (self.dummy_heading[i] - heading) % 4
+            waypoint = self.valid_actions[self.dummy_waypoint[i]]
+            if relation == 2: # Oncoming
+                if inputs['oncoming'] != 'left':
+                    inputs['oncoming'] = waypoint
+            elif relation == 1: # From the right
+                if inputs['right'] != 'forward' and inputs['right'] != 'left':
+                    inputs['right'] = waypoint
+            elif relation == 3: # From the left
+                if inputs['left'] != 'forward':
+                    inputs['left'] = waypoint
+
+        return inputs
@@ -0,0 +1,162 @@
+""" Benchmark suite for the environment hot path and training wall-clock.
+
+Runs a fixed-seed training cycle (Simulator.run() in headless mode) for every
+combination of dummy count and grid size, each in a fresh process, and
+records setup time, steps/sec, time spent per phase and peak memory. Results
+are saved as JSON so that successive versions can be compared:
+
+    python -m smartcab.benchmark --output logs/bench-new.json --compare logs/bench-old.json
+"""
+import os
+import json
+import time
+import random
+import platform
+import argparse
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+
+from environment import Environment
+from array_environment import ArrayEnvironment
+from agent import LearningAgent
+from simulator import Simulator
+
+
+engines = {'environment': Environment, 'array': ArrayEnvironment}
+
+default_dummies = [10, 100, 500, 2000]
+default_grids = [(8, 6), (16, 16), (32, 32), (64, 64)]
+
+
+def run_scenario(scenario):
+    """ Run one benchmark scenario and return its measurements.
+        Executed in a fresh worker process so peak memory is per scenario. """
+
+    random.seed(scenario['seed'])
+    start = time.time()
+    env = engines[scenario['engine']](num_dummies=scenario['num_dummies'], grid_size=tuple(scenario['grid_size']), seed=scenario['seed'])
+    agent = env.create_agent(LearningAgent, learning=True, epsilon=1.0, alpha=0.5, edecay=scenario['edecay'])
+    env.set_primary_agent(agent, enforce_deadline=True)
+    setup_seconds = time.time() - start
+
+    log_file, log_filename = tempfile.mkstemp(suffix=".csv")
+    os.close(log_file)
+    try:
+        sim = Simulator(env, display=False, log_metrics=True, headless=True, log_filename=log_filename,
+                        profile=['primary_update', 'dummy_updates', 'light_updates', 'logging'])
+
+        start = time.time()
+        sim.run(tolerance=0.05, n_test=scenario['n_test'])
+        seconds = time.time() - start
+        phases = sim.profiler.seconds()
+    finally:
+        for filename in (log_filename, os.path.splitext(log_filename)[0] + ".txt"):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    result = dict(scenario)
+    result.update({
+        'setup_seconds': setup_seconds,
+        'steps': sim.step_count,
+        'seconds': seconds,
+        'steps_per_sec': sim.step_count / seconds if seconds > 0 else None,
+        'phases': phases,
+        'peak_memory_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,  # kilobytes on Linux
+    })
+    return result
+
+
+def scenarios(dummies, grids, engine='environment', seed=0, edecay="r95", n_test=10):
+    """ Every (num_dummies, grid_size) pair whose dummies fit on the grid
+        (at most one dummy per intersection and heading). """
+
+    return [{'engine': engine, 'num_dummies': n, 'grid_size': list(grid), 'seed': seed, 'edecay': edecay, 'n_test': n_test}
+            for grid in grids for n in dummies if n <= grid[0] * grid[1] * 4]
+
+
+def run(scenario_list):
+    """ Run each scenario in turn, each in its own process. """
+
+    results = []
+    for scenario in scenario_list:
+        pool = multiprocessing.Pool(processes=1)
+        try:
+            results.append(pool.apply(run_scenario, (scenario,)))
+        finally:
+            pool.close()
+            pool.join()
+    return results
+
+
+def version():
+    """ The git commit being benchmarked, if available. """
+
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def scenario_key(result):
+    return (result['engine'], result['num_dummies'], tuple(result['grid_size']))
+
+
+def report(results, baseline=None):
+    """ Print a table of the results, with the speed-up over 'baseline' if given. """
+
+    previous = {scenario_key(result): result for result in (baseline or {}).get('results', [])}
+    print "{:<12} {:>8} {:>9} {:>9} {:>11} {:>9} {:>9} {:>9} {:>9} {:>10} {:>8}".format(
+        "engine", "dummies", "grid", "setup(s)", "steps/sec", "primary", "dummies", "lights", "logging", "peak(MB)", "speedup")
+    for result in results:
+        phases = result['phases']
+        old = previous.get(scenario_key(result))
+        speedup = "{:.2f}x".format(result['steps_per_sec'] / old['steps_per_sec']) if old and old['steps_per_sec'] else "-"
+        print "{:<12} {:>8} {:>9} {:>9.2f} {:>11.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.3f} {:>10.1f} {:>8}".format(
+            result['engine'], result['num_dummies'], "{}x{}".format(*result['grid_size']), result['setup_seconds'],
+            result['steps_per_sec'], phases['primary_update'], phases['dummy_updates'], phases['light_updates'],
+            phases['logging'], result['peak_memory_kb'] / 1024.0, speedup)
+
+
+def parse_grid(text):
+    columns, rows = text.lower().split("x")
+    return (int(columns), int(rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark environment step throughput and training wall-clock.")
+    parser.add_argument('--dummies', default=",".join(str(n) for n in default_dummies), help="comma separated dummy counts")
+    parser.add_argument('--grids', default=",".join("{}x{}".format(*grid) for grid in default_grids), help="comma separated grid sizes, eg. 8x6,64x64")
+    parser.add_argument('--engine', choices=sorted(engines), default='environment')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--n-test', type=int, default=10)
+    parser.add_argument('--output', default=os.path.join("logs", "benchmark.json"))
+    parser.add_argument('--compare', help="previous benchmark JSON to compare steps/sec against")
+    args = parser.parse_args()
+
+    scenario_list = scenarios([int(n) for n in args.dummies.split(",")], [parse_grid(grid) for grid in args.grids.split(",")],
+                              engine=args.engine, seed=args.seed, n_test=args.n_test)
+    results = run(scenario_list)
+
+    output = {
+        'version': version(),
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'results': results,
+    }
+    directory = os.path.dirname(args.output)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2, sort_keys=True)
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,13 @@
 import time
 import random
 import math
+import itertools
 from collections import OrderedDict
 from simulator import Simulator
+from logger import get_logger
+from rng import stream
+
+log = get_logger("environment")
 
 
 class TrafficLight(object):
@@ -10,9 +15,9 @@ class TrafficLight(object):
 
     valid_states = [True, False]  # True = NS open; False = EW open
 
-    def __init__(self, state=None, period=None):
-        self.state = state if state is not None else random.choice(self.valid_states)
-        self.period = period if period is not None else random.choice([2, 3, 4, 5])
+    def __init__(self, state=None, period=None, rng=random):
+        self.state = state if state is not None else rng.choice(self.valid_states)
+        self.period = period if period is not None else rng.choice([2, 3, 4, 5])
         self.last_updated = 0
 
     def reset(self):
@@ -24,6 +29,82 @@ class TrafficLight(object):
             self.last_updated = t
 
 
+def traffic_violation(action, light, oncoming, left, right):
+    """ The violation committed by taking 'action' at a 'light' with the
+        given traffic: 0 if legal, 1 minor and 2 major violation, 3 minor
+        and 4 major accident. """
+
+    violation = 0
+
+    # Agent wants to drive forward:
+    if action == 'forward':
+        if light != 'green': # Running red light
+            violation = 2 # Major violation
+            if left == 'forward' or right == 'forward': # Cross traffic
+                violation = 4 # Accident
+
+    # Agent wants to drive left:
+    elif action == 'left':
+        if light != 'green': # Running a red light
+            violation = 2 # Major violation
+            if left == 'forward' or right == 'forward': # Cross traffic
+                violation = 4 # Accident
+            elif oncoming == 'right': # Oncoming car turning right
+                violation = 4 # Accident
+        else: # Green light
+            if oncoming == 'right' or oncoming == 'forward': # Incoming traffic
+                violation = 3 # Accident
+
+    # Agent wants to drive right:
+    elif action == 'right':
+        if light != 'green' and left == 'forward': # Cross traffic
+            violation = 3 # Accident
+
+    # Agent wants to perform no action:
+    elif action == None:
+        if light == 'green' and oncoming != 'left': # No oncoming traffic
+            violation = 1 # Minor violation
+
+    return violation
+
+
+def violation_table(actions):
+    """ traffic_violation() for every (action, light, oncoming, left, right). """
+
+    return {key: traffic_violation(*key) for key in itertools.product(actions, ['green', 'red'], actions, actions, actions)}
+
+
+class AgentState(object):
+    """ Where an agent is in the environment and, for the primary agent, where
+        it is going. 'heading' is an index into Environment.valid_headings.
+
+        Item access (state['heading']) is kept for code written against the
+        dict states this record replaces, and reads and writes the heading
+        as a tuple. """
+
+    __slots__ = ('location', 'heading', 'destination', 'deadline')
+
+    def __init__(self, location, heading, destination=None, deadline=None):
+        self.location = location
+        self.heading = heading
+        self.destination = destination
+        self.deadline = deadline
+
+    def __getitem__(self, key):
+        if key == 'heading':
+            return Environment.valid_headings[self.heading]
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key == 'heading':
+            value = Environment.valid_headings.index(tuple(value))
+        setattr(self, key, value)
+
+    def __repr__(self):
+        return "AgentState(location={}, heading={}, destination={}, deadline={})".format(
+            self.location, self['heading'], self.destination, self.deadline)
+
+
 class Environment(object):
     """Environment within which all agents operate."""
 
@@ -32,16 +113,44 @@ class Environment(object):
     valid_headings = [(1, 0), (0, -1), (-1, 0), (0, 1)]  # E, N, W, S
     hard_time_limit = -100  # Set a hard time limit even if deadline is not enforced.
 
-    def __init__(self, verbose=False, num_dummies=100, grid_size = (8, 6)):
+    road_networks = dict()  # grid_size -> roads, shared by every environment with that grid
+
+    # Traffic laws: (action, light, oncoming, left, right) -> violation, see traffic_violation()
+    violations = violation_table(valid_actions)
+    violation_rewards = {1: -5, 2: -10, 3: -20, 4: -40}  # minor, major violation; minor, major accident
+    action_turns = {None: 0, 'forward': 0, 'left': 1, 'right': 3}  # change in heading index of a legal move
+    deadline_penalties = dict()  # (t, deadline) -> penalty factor
+
+    def __init__(self, verbose=False, num_dummies=100, grid_size = (8, 6), seed=None, lod_radius=None):
         self.num_dummies = num_dummies  # Number of dummy driver agents in the environment
         self.verbose = verbose # If debug output should be given
 
+        # Level of detail: if set, only dummies within this many intersections of
+        # the primary agent are simulated, see update_lod_area()
+        self.lod_radius = lod_radius
+        self.lod_center = None  # primary agent and learner locations the active area was computed for
+        self.lod_active = set()  # intersections whose dummies are simulated
+        self.lod_lights = set()  # their traffic lights
+        self.parked_lights = set()  # lights out of range, left out of the timing wheel until they're back in range
+
+        # Random number streams, each derived from the run 'seed' so that runs are
+        # reproducible and components don't perturb each other's draws.
+        # Without a seed, every stream is the global 'random' module as before
+        self.seed = seed
+        self.random = self.stream('environment')         # start, destination and dummy placement
+        self.light_random = self.stream('lights')        # traffic light states and periods
+        self.reward_random = self.stream('rewards')      # reward noise
+        self.dummy_random = self.stream('dummies')       # shared by all dummy agents
+
         # Initialize simulation variables
         self.done = False
         self.t = 0
         self.agent_states = OrderedDict()
+        self.dummies = []  # DummyAgents, advanced together by update_agents()
+        self.occupancy = dict()  # location -> {heading index: [agents]}, kept in sync with agent_states
         self.step_data = {}
         self.success = None
+        self.trace = None  # optional StepTrace recording every step of the primary agent
 
         # Road network
         self.grid_size = grid_size  # (columns, rows)
@@ -52,22 +161,29 @@ class Environment(object):
         self.roads = []
         for x in xrange(self.bounds[0], self.bounds[2] + 1):
             for y in xrange(self.bounds[1], self.bounds[3] + 1):
-                self.intersections[(x, y)] = TrafficLight()  # A traffic light at each intersection
+                self.intersections[(x, y)] = TrafficLight(rng=self.light_random)  # A traffic light at each intersection
+        self.intersection_list = list(self.intersections)  # for indexed sampling
+        self.slots = [(location, heading) for location in self.intersection_list for heading in xrange(len(self.valid_headings))]  # dummy start positions
+        self.schedule_lights()
 
-        for a in self.intersections:
-            for b in self.intersections:
-                if a == b:
-                    continue
-                if (abs(a[0] - b[0]) + abs(a[1] - b[1])) == 1:  # L1 distance = 1
-                    self.roads.append((a, b))
+        if tuple(self.grid_size) in self.road_networks:
+            self.roads = self.road_networks[tuple(self.grid_size)]
+        else:
+            for a in self.intersections:
+                for offset in ((-1, 0), (0, -1), (0, 1), (1, 0)):  # L1 distance = 1
+                    b = (a[0] + offset[0], a[1] + offset[1])
+                    if b in self.intersections:
+                        self.roads.append((a, b))
+
+            # Add environment boundaries
+            for x in xrange(self.bounds[0], self.bounds[2] + 1):
+                self.roads.append(((x, self.bounds[1] - self.hang), (x, self.bounds[1])))
+                self.roads.append(((x, self.bounds[3] + self.hang), (x, self.bounds[3])))
+            for y in xrange(self.bounds[1], self.bounds[3] + 1):
+                self.roads.append(((self.bounds[0] - self.hang, y), (self.bounds[0], y)))
+                self.roads.append(((self.bounds[2] + self.hang, y), (self.bounds[2], y)))    
 
-        # Add environment boundaries
-        for x in xrange(self.bounds[0], self.bounds[2] + 1):
-            self.roads.append(((x, self.bounds[1] - self.hang), (x, self.bounds[1])))
-            self.roads.append(((x, self.bounds[3] + self.hang), (x, self.bounds[3])))
-        for y in xrange(self.bounds[1], self.bounds[3] + 1):
-            self.roads.append(((self.bounds[0] - self.hang, y), (self.bounds[0], y)))
-            self.roads.append(((self.bounds[2] + self.hang, y), (self.bounds[2], y)))    
+            self.road_networks[tuple(self.grid_size)] = self.roads
 
         # Create dummy agents
         for i in xrange(self.num_dummies):
@@ -77,6 +193,11 @@ class Environment(object):
         self.primary_agent = None  # to be set explicitly
         self.enforce_deadline = False
 
+        # Other learning agents, each driving trips of its own (see add_learner())
+        self.learners = OrderedDict()  # learner -> data of its current trip, None between trips
+        self.trip_counts = dict()  # learner -> trips started so far
+        self.finished_trips = []  # (learner, trip data) of the trips ended since the last finish_trips()
+
         # Trial data (updated at the end of each trial)
         self.trial_data = {
             'testing': False, # if the trial is for testing a learned policy
@@ -92,9 +213,49 @@ class Environment(object):
         """ When called, create_agent creates an agent in the environment. """
 
         agent = agent_class(self, *args, **kwargs)
-        self.agent_states[agent] = {'location': random.choice(self.intersections.keys()), 'heading': (0, 1)}
+        state = AgentState(self.random.choice(self.intersection_list), 3)  # facing South
+        self.agent_states[agent] = state
+        self._place_agent(agent, state.location, state.heading)
+        if isinstance(agent, DummyAgent):
+            self.dummies.append(agent)
         return agent
 
+    def _place_agent(self, agent, location, heading):
+        """ Add 'agent' to the occupancy index at 'location', facing 'heading'. """
+
+        self.occupancy.setdefault(location, {}).setdefault(heading, []).append(agent)
+
+    def _remove_agent(self, agent, location, heading):
+        """ Remove 'agent' from the occupancy index at 'location', facing 'heading'. """
+
+        headings = self.occupancy[location]
+        agents = headings[heading]
+        agents.remove(agent)
+        if not agents:
+            del headings[heading]
+            if not headings:
+                del self.occupancy[location]
+
+    def _next_location(self, location, heading):
+        """ The intersection next to 'location' along 'heading', wrapping around the grid. """
+
+        direction = self.valid_headings[heading]
+        return ((location[0] + direction[0] - self.bounds[0]) % (self.bounds[2] - self.bounds[0] + 1) + self.bounds[0],
+                (location[1] + direction[1] - self.bounds[1]) % (self.bounds[3] - self.bounds[1] + 1) + self.bounds[1])
+
+    def _move_agent(self, agent, state, location, heading):
+        """ Move 'agent' to 'location', facing 'heading', and keep the occupancy index in sync. """
+
+        self._remove_agent(agent, state.location, state.heading)
+        self._place_agent(agent, location, heading)
+        state.location = location
+        state.heading = heading
+
+    def stream(self, *names):
+        """ Returns the random number stream 'names' (eg. "agent", 3) of this run. """
+
+        return stream(self.seed, *names)
+
     def set_primary_agent(self, agent, enforce_deadline=False):
         """ When called, set_primary_agent sets 'agent' as the primary agent.
             The primary agent is the smartcab that is followed in the environment. """
@@ -103,69 +264,144 @@ class Environment(object):
         agent.primary_agent = True
         self.enforce_deadline = enforce_deadline
 
+    def add_learner(self, agent):
+        """ Add a learning 'agent' that drives alongside the primary agent.
+            Each learner is sent on trips of its own, with a destination and
+            deadline like the primary agent's: when it arrives or runs out of
+            time, the trip is recorded (see finish_trips()) and a new one
+            starts on the next step. The trial still ends with the primary
+            agent's. Like the primary agent, learners are left out of every
+            agent's sense() inputs. Add learners before the first reset(). """
+
+        assert agent in self.agent_states, "Unknown agent!"
+        assert agent is not self.primary_agent, "The primary agent can't be a learner!"
+        self.learners[agent] = None
+        self.trip_counts[agent] = 0
+
+    def pick_route(self):
+        """ A random start and destination at least 4 intersections apart. """
+
+        start = self.random.choice(self.intersection_list)
+        destination = self.random.choice(self.intersection_list)
+
+        # Ensure starting location and destination are not too close
+        while self.compute_dist(start, destination) < 4:
+            start = self.random.choice(self.intersection_list)
+            destination = self.random.choice(self.intersection_list)
+        return start, destination
+
+    def start_trip(self, agent, testing=False):
+        """ Send the learner 'agent' on a new trip from a random start. """
+
+        start, destination = self.pick_route()
+        heading = self.random.randrange(len(self.valid_headings))
+        deadline = self.compute_dist(start, destination) * 5  # 5 time steps per intersection away
+
+        state = self.agent_states[agent]
+        self._move_agent(agent, state, start, heading)
+        state.destination = destination
+        state.deadline = deadline
+
+        # Mid-trial, bring the new start into the level of detail area before the learner senses
+        if self.lod_active:
+            self.update_lod_area()
+
+        self.trip_counts[agent] += 1
+        self.learners[agent] = {
+            'trip': self.trip_counts[agent],
+            'start_t': self.t,  # time step the trip started at
+            'testing': testing,
+            'initial_deadline': deadline,
+            'final_deadline': deadline,
+            'net_reward': 0.0,
+            'actions': {0: 0, 1: 0, 2: 0, 3: 0, 4: 0},
+            'success': 0,
+            'steps': 0,
+        }
+        agent.reset(destination=destination, testing=testing)
+        self.learners[agent]['parameters'] = {'e': agent.epsilon, 'a': agent.alpha}  # after reset() decays them
+
+    def end_trip(self, agent, steps):
+        """ Record the learner 'agent's current trip, 'steps' long. """
+
+        trip = self.learners[agent]
+        trip['steps'] = steps
+        self.finished_trips.append((agent, trip))
+        self.learners[agent] = None
+
+    def finish_trips(self):
+        """ Returns the (learner, trip data) of every trip ended since the
+            last call, once the trial is over, including the trips still under
+            way, which are recorded as unsuccessful. The trip data has the
+            same fields as 'trial_data', plus the trip number and the 'steps'
+            taken. """
+
+        for agent, trip in self.learners.iteritems():
+            if trip is not None and self.t > trip['start_t']:
+                self.end_trip(agent, self.t - trip['start_t'])
+        trips = self.finished_trips
+        self.finished_trips = []
+        return trips
+
     def reset(self, testing=False):
         """ This function is called at the beginning of a new trial. """
 
         self.done = False
+
+        # Lights keep their state from trial to trial: parked lights catch up on
+        # the switches they missed during the last trial before being rescheduled
+        for traffic_light in self.parked_lights:
+            self._catch_up_light(traffic_light)
         self.t = 0
 
         # Reset status text
         self.step_data = {}
 
+        # Recompute the level of detail area on the first step
+        self.lod_center = None
+        self.lod_active = set()
+        self.lod_lights = set()
+        self.parked_lights = set()
+
         # Reset traffic lights
         for traffic_light in self.intersections.itervalues():
             traffic_light.reset()
+        self.schedule_lights()
 
         # Pick a start and a destination
-        start = random.choice(self.intersections.keys())
-        destination = random.choice(self.intersections.keys())
+        start, destination = self.pick_route()
 
-        # Ensure starting location and destination are not too close
-        while self.compute_dist(start, destination) < 4:
-            start = random.choice(self.intersections.keys())
-            destination = random.choice(self.intersections.keys())
-
-        start_heading = random.choice(self.valid_headings)
+        start_heading = self.random.randrange(len(self.valid_headings))
         distance = self.compute_dist(start, destination)
         deadline = distance * 5 # 5 time steps per intersection away
         if(self.verbose == True): # Debugging
-            print "Environment.reset(): Trial set up with start = {}, destination = {}, deadline = {}".format(start, destination, deadline)
+            log.debug("Environment.reset(): Trial set up with start = {}, destination = {}, deadline = {}".format(start, destination, deadline))
 
-        # Create a map of all possible initial positions
-        positions = dict()
-        for location in self.intersections:
-            positions[location] = list()
-            for heading in self.valid_headings:
-                positions[location].append(heading)
+        # Give each dummy agent a distinct (intersection, heading) position
+        dummies = [agent for agent in self.agent_states if agent is not self.primary_agent and agent not in self.learners]
+        positions = iter(self.random.sample(self.slots, len(dummies)))
 
         # Initialize agent(s)
+        self.occupancy = dict()
+        self.finished_trips = []
         for agent in self.agent_states.iterkeys():
 
             if agent is self.primary_agent:
-                self.agent_states[agent] = {
-                    'location': start,
-                    'heading': start_heading,
-                    'destination': destination,
-                    'deadline': deadline
-                }
-            # For dummy agents, make them choose one of the available 
-            # intersections and headings still in 'positions'
+                state = AgentState(start, start_heading, destination, deadline)
+            elif agent in self.learners:
+                state = AgentState(start, start_heading)  # moved to the start of its trip below
             else:
-                intersection = random.choice(positions.keys())
-                heading = random.choice(positions[intersection])
-                self.agent_states[agent] = {
-                    'location': intersection,
-                    'heading': heading,
-                    'destination': None,
-                    'deadline': None
-                }
-                # Now delete the taken location and heading from 'positions'
-                positions[intersection] = list(set(positions[intersection]) - set([heading]))
-                if positions[intersection] == list(): # No headings available for intersection
-                    del positions[intersection] # Delete the intersection altogether
+                intersection, heading = next(positions)
+                state = AgentState(intersection, heading)
+            self.agent_states[agent] = state
 
+            self._place_agent(agent, state.location, state.heading)
+
+            if agent in self.learners:
+                self.start_trip(agent, testing)
+                continue
     
-            agent.reset(destination=(destination if agent is self.primary_agent else None), testing=testing)
+            agent.reset(destination=state.destination, testing=testing)
             if agent is self.primary_agent:
                 # Reset metrics for this trial (step data will be set during the step)
                 self.trial_data['testing'] = testing
@@ -179,46 +415,218 @@ class Environment(object):
     def step(self):
         """ This function is called when a time step is taken turing a trial. """
 
-        # Pretty print to terminal
-        print ""
-        print "/-------------------"
-        print "| Step {} Results".format(self.t)
-        print "\-------------------"
-        print ""
-
         if(self.verbose == True): # Debugging
-            print "Environment.step(): t = {}".format(self.t)
+            log.debug("Environment.step(): t = {}".format(self.t))
+
+        # Level of detail: the intersections whose dummies and lights are simulated this step.
+        # Picked before any agent senses, so that learners sent on a new trip at the end of
+        # the last step find their intersection up to date
+        if self.lod_radius is not None and self.primary_agent is not None:
+            self.update_lod_area()
 
         # Update agents, primary first
         if self.primary_agent is not None:
             self.primary_agent.update()
 
-        for agent in self.agent_states.iterkeys():
-            if agent is not self.primary_agent:
-                agent.update()
+        self.update_agents()
 
         # Update traffic lights
-        for intersection, traffic_light in self.intersections.iteritems():
-            traffic_light.update(self.t)
+        self.update_lights()
 
         if self.primary_agent is not None:
             # Agent has taken an action: reduce the deadline by 1
-            agent_deadline = self.agent_states[self.primary_agent]['deadline'] - 1
-            self.agent_states[self.primary_agent]['deadline'] = agent_deadline
+            agent_deadline = self.agent_states[self.primary_agent].deadline - 1
+            self.agent_states[self.primary_agent].deadline = agent_deadline
 
             if agent_deadline <= self.hard_time_limit:
                 self.done = True
                 self.success = False
                 if self.verbose: # Debugging
-                    print "Environment.step(): Primary agent hit hard time limit ({})! Trial aborted.".format(self.hard_time_limit)
+                    log.debug("Environment.step(): Primary agent hit hard time limit ({})! Trial aborted.".format(self.hard_time_limit))
             elif self.enforce_deadline and agent_deadline <= 0:
                 self.done = True
                 self.success = False
                 if self.verbose: # Debugging
-                    print "Environment.step(): Primary agent ran out of time! Trial aborted."
+                    log.debug("Environment.step(): Primary agent ran out of time! Trial aborted.")
+
+        # Count down the learners' deadlines in the same way, ending their trips when out of time
+        for agent, trip in self.learners.iteritems():
+            if trip is not None:
+                state = self.agent_states[agent]
+                state.deadline -= 1
+                if state.deadline <= self.hard_time_limit or (self.enforce_deadline and state.deadline <= 0):
+                    self.end_trip(agent, self.t + 1 - trip['start_t'])
 
         self.t += 1
 
+        # Send the learners whose trip has ended on a new one
+        if not self.done:
+            for agent, trip in self.learners.items():
+                if trip is None:
+                    self.start_trip(agent, self.trial_data['testing'])
+
+    def update_agents(self):
+        """ Update every agent other than the primary agent.
+
+            Dummy agents are advanced together, one intersection at a time:
+            the traffic at an intersection is sensed once, as it stands before
+            any dummy moves, and every dummy there whose waypoint is legal
+            then moves. Dummies don't learn, so no reward is computed for them.
+
+            With a 'lod_radius', only the dummies in the area step() picked
+            around the primary agent (and any learners) are advanced, see
+            update_lod_area(). """
+
+        # Any agents besides the primary agent and the dummies
+        if len(self.agent_states) > len(self.dummies) + (self.primary_agent is not None):
+            for agent in self.agent_states.iterkeys():
+                if agent is not self.primary_agent and not isinstance(agent, DummyAgent):
+                    agent.update()
+
+        if not self.dummies:
+            return
+
+        area = None
+        traffic_at = self.occupancy.iteritems()
+        if self.lod_radius is not None and self.primary_agent is not None:
+            area = self.lod_active
+            occupancy = self.occupancy
+            traffic_at = [(location, occupancy[location]) for location in area if location in occupancy]
+
+        moves = []
+        for location, lanes in traffic_at:
+            light_state = self.intersections[location].state
+
+            # What sense() reports of each lane, seen as oncoming, right and left traffic
+            traffic = dict()
+            for heading, agents in lanes.iteritems():
+                oncoming = right = left = None
+                for agent in agents:
+                    if agent is self.primary_agent or agent in self.learners:
+                        continue
+                    waypoint = agent.next_waypoint
+                    if oncoming != 'left':
+                        oncoming = waypoint
+                    if right != 'forward' and right != 'left':
+                        right = waypoint
+                    if left != 'forward':
+                        left = waypoint
+                traffic[heading] = (oncoming, right, left)
+
+            for heading, agents in lanes.iteritems():
+                light = 'green' if light_state == (heading % 2 == 1) else 'red'
+                oncoming = traffic.get((heading + 2) % 4, (None, None, None))[0]
+                right = traffic.get((heading + 1) % 4, (None, None, None))[1]
+                left = traffic.get((heading + 3) % 4, (None, None, None))[2]
+                for agent in agents:
+                    if isinstance(agent, DummyAgent):
+                        if self.violations[(agent.next_waypoint, light, oncoming, left, right)] == 0:
+                            moves.append((agent, (heading + self.action_turns[agent.next_waypoint]) % 4))
+
+        # Move the dummies and choose their next waypoints.
+        # A dummy driving out of the level of detail area comes back in at its far edge,
+        # standing in for the dummy that would have driven in from outside
+        agent_states = self.agent_states
+        for agent, heading in moves:
+            state = agent_states[agent]
+            location = self._next_location(state.location, heading)
+            if area is not None and location not in area:
+                location = self.lod_entry(state.location, heading, area)
+            self._move_agent(agent, state, location, heading)
+            agent.next_waypoint = agent.random.choice(self.valid_actions[1:])
+
+    def lod_area(self, location):
+        """ The intersections at most 'lod_radius' columns and rows away from
+            'location', wrapping around the grid. """
+
+        columns = self.bounds[2] - self.bounds[0] + 1
+        rows = self.bounds[3] - self.bounds[1] + 1
+        radius = self.lod_radius
+        xs = set((location[0] + dx - self.bounds[0]) % columns + self.bounds[0] for dx in xrange(-radius, radius + 1))
+        ys = set((location[1] + dy - self.bounds[1]) % rows + self.bounds[1] for dy in xrange(-radius, radius + 1))
+        return set((x, y) for x in xs for y in ys)
+
+    def lod_entry(self, location, heading, area):
+        """ Where a dummy leaving 'area' from 'location' along 'heading' comes
+            back in: the last intersection of the area behind it on its road,
+            as if it had just driven in from outside. With a 'lod_radius' of 0
+            that is 'location' itself, so the dummy only turns. """
+
+        back = (heading + 2) % 4
+        for i in xrange(max(self.grid_size)):
+            previous = self._next_location(location, back)
+            if previous not in area:
+                break
+            location = previous
+        return location
+
+    def update_lod_area(self):
+        """ Returns the intersections around the primary agent and any
+            learners whose dummies are simulated, so that the cost of a step doesn't grow with the
+            size of the grid. Dummies elsewhere stand still, which keeps them
+            spread as they were, and their traffic lights are left alone.
+            Dummies don't leave the area: one driving out comes back in on
+            the opposite side (see lod_entry()), which keeps the number
+            inside the area, and their spread, the same as the traffic
+            driving in and out of it would.
+            Dummies at intersections that have just come into range pick fresh
+            waypoints, as if they had kept driving, and the lights there catch
+            up on the switches they missed. """
+
+        centers = tuple(self.agent_states[agent].location for agent in [self.primary_agent] + self.learners.keys())
+        if centers != self.lod_center:
+            area = self.lod_area(centers[0])
+            for location in centers[1:]:
+                area |= self.lod_area(location)
+            occupancy = self.occupancy
+            for entered in area - self.lod_active:
+                traffic_light = self.intersections[entered]
+                if traffic_light in self.parked_lights:
+                    self.parked_lights.remove(traffic_light)
+                    self._catch_up_light(traffic_light)
+                    self.light_schedule.setdefault(traffic_light.last_updated + traffic_light.period, []).append(traffic_light)
+                if entered in occupancy:
+                    for agents in occupancy[entered].itervalues():
+                        for agent in agents:
+                            if isinstance(agent, DummyAgent):
+                                agent.next_waypoint = agent.random.choice(self.valid_actions[1:])
+            self.lod_center = centers
+            self.lod_active = area
+            self.lod_lights = set(self.intersections[location] for location in area)
+        return self.lod_active
+
+    def _catch_up_light(self, traffic_light):
+        """ Apply the switches of a parked 'traffic_light' that were due
+            before this time step. """
+
+        missed = (self.t - 1 - traffic_light.last_updated) // traffic_light.period
+        if missed > 0:
+            traffic_light.state = traffic_light.state != (missed % 2 == 1)
+            traffic_light.last_updated += missed * traffic_light.period
+
+    def schedule_lights(self):
+        """ Rebuild the timing wheel of traffic lights: time step -> the
+            lights due to toggle at that step. """
+
+        self.light_schedule = dict()
+        for traffic_light in self.intersections.itervalues():
+            self.light_schedule.setdefault(traffic_light.last_updated + traffic_light.period, []).append(traffic_light)
+
+    def update_lights(self):
+        """ Update the traffic lights that are due to toggle at this time
+            step; lights that aren't are never visited. With a 'lod_radius',
+            lights out of range are parked instead, see update_lod_area(). """
+
+        due = self.light_schedule.pop(self.t, None)
+        if due is not None:
+            lod = self.lod_radius is not None and self.primary_agent is not None
+            for traffic_light in due:
+                if lod and traffic_light not in self.lod_lights:
+                    self.parked_lights.add(traffic_light)
+                    continue
+                traffic_light.update(self.t)
+                self.light_schedule.setdefault(traffic_light.last_updated + traffic_light.period, []).append(traffic_light)
+
     def sense(self, agent):
         """ This function is called when information is requested about the sensor
             inputs from an 'agent' in the environment. """
@@ -226,51 +634,57 @@ class Environment(object):
         assert agent in self.agent_states, "Unknown agent!"
 
         state = self.agent_states[agent]
-        location = state['location']
-        heading = state['heading']
-        light = 'green' if (self.intersections[location].state and heading[1] != 0) or ((not self.intersections[location].state) and heading[0] != 0) else 'red'
+        location = state.location
+        heading = state.heading
+        light = 'green' if self.intersections[location].state == (heading % 2 == 1) else 'red'  # NS open and facing N or S, or EW open and facing E or W
 
         # Populate oncoming, left, right
+        # Only agents at the same intersection are visited, via the occupancy index
         oncoming = None
         left = None
         right = None
-        for other_agent, other_state in self.agent_states.iteritems():
-            if agent == other_agent or location != other_state['location'] or (heading[0] == other_state['heading'][0] and heading[1] == other_state['heading'][1]):
+        for other_heading, other_agents in self.occupancy[location].iteritems():
+            if other_heading == heading:
                 continue
-            # For dummy agents, ignore the primary agent
-            # This is because the primary agent is not required to follow the waypoint
-            if other_agent == self.primary_agent:
-                continue
-            other_heading = other_agent.get_next_waypoint()
-            if (heading[0] * other_state['heading'][0] + heading[1] * other_state['heading'][1]) == -1:
-                if oncoming != 'left':  # we don't want to override oncoming == 'left'
-                    oncoming = other_heading
-            elif (heading[1] == other_state['heading'][0] and -heading[0] == other_state['heading'][1]):
-                if right != 'forward' and right != 'left':  # we don't want to override right == 'forward or 'left'
-                    right = other_heading
-            else:
-                if left != 'forward':  # we don't want to override left == 'forward'
-                    left = other_heading
+            is_oncoming = (other_heading - heading) % 4 == 2
+            is_right = (other_heading - heading) % 4 == 1
+            for other_agent in other_agents:
+                # For dummy agents, ignore the primary agent and the other learners
+                # This is because the primary agent is not required to follow the waypoint
+                if other_agent is self.primary_agent or other_agent in self.learners:
+                    continue
+                other_waypoint = other_agent.get_next_waypoint()
+                if is_oncoming:
+                    if oncoming != 'left':  # we don't want to override oncoming == 'left'
+                        oncoming = other_waypoint
+                elif is_right:
+                    if right != 'forward' and right != 'left':  # we don't want to override right == 'forward or 'left'
+                        right = other_waypoint
+                else:
+                    if left != 'forward':  # we don't want to override left == 'forward'
+                        left = other_waypoint
 
         return {'light': light, 'oncoming': oncoming, 'left': left, 'right': right}
 
     def get_deadline(self, agent):
         """ Returns the deadline remaining for an agent. """
 
-        return self.agent_states[agent]['deadline'] if agent is self.primary_agent else None
+        return self.agent_states[agent].deadline if agent is self.primary_agent or agent in self.learners else None
 
-    def act(self, agent, action):
+    def act(self, agent, action, inputs=None):
         """ Consider an action and perform the action if it is legal.
-            Receive a reward for the agent based on traffic laws. """
+            Receive a reward for the agent based on traffic laws.
+            'inputs' are the agent's sense() inputs, if it has just sensed. """
 
         assert agent in self.agent_states, "Unknown agent!"
         assert action in self.valid_actions, "Invalid action!"
 
         state = self.agent_states[agent]
-        location = state['location']
-        heading = state['heading']
-        light = 'green' if (self.intersections[location].state and heading[1] != 0) or ((not self.intersections[location].state) and heading[0] != 0) else 'red'
-        inputs = self.sense(agent)
+        location = state.location
+        heading = state.heading
+        if inputs is None:
+            inputs = self.sense(agent)
+        light = inputs['light']
 
         # Assess whether the agent can move based on the action chosen.
         # Either the action is okay to perform, or falls under 4 types of violations:
@@ -279,57 +693,21 @@ class Environment(object):
         # 2: Major traffic violation
         # 3: Minor traffic violation causing an accident
         # 4: Major traffic violation causing an accident
-        violation = 0
+        violation = self.violations[(action, light, inputs['oncoming'], inputs['left'], inputs['right'])]
 
         # Reward scheme
         # First initialize reward uniformly random from [-1, 1]
-        reward = 2 * random.random() - 1
+        reward = 2 * self.reward_random.random() - 1
 
-        # Create a penalty factor as a function of remaining deadline
-        # Scales reward multiplicatively from [0, 1]
-        fnc = self.t * 1.0 / (self.t + state['deadline']) if agent.primary_agent else 0.0
-        gradient = 10
-        
         # No penalty given to an agent that has no enforced deadline
         penalty = 0
 
-        # If the deadline is enforced, give a penalty based on time remaining
+        # If the deadline is enforced, give the primary agent and the learners a penalty based on time remaining
         if self.enforce_deadline:
-            penalty = (math.pow(gradient, fnc) - 1) / (gradient - 1)
-
-        # Agent wants to drive forward:
-        if action == 'forward':
-            if light != 'green': # Running red light
-                violation = 2 # Major violation
-                if inputs['left'] == 'forward' or inputs['right'] == 'forward': # Cross traffic
-                    violation = 4 # Accident
-        
-        # Agent wants to drive left:
-        elif action == 'left':
-            if light != 'green': # Running a red light
-                violation = 2 # Major violation
-                if inputs['left'] == 'forward' or inputs['right'] == 'forward': # Cross traffic
-                    violation = 4 # Accident
-                elif inputs['oncoming'] == 'right': # Oncoming car turning right
-                    violation = 4 # Accident
-            else: # Green light
-                if inputs['oncoming'] == 'right' or inputs['oncoming'] == 'forward': # Incoming traffic
-                    violation = 3 # Accident
-                else: # Valid move!
-                    heading = (heading[1], -heading[0])
-
-        # Agent wants to drive right:
-        elif action == 'right':
-            if light != 'green' and inputs['left'] == 'forward': # Cross traffic
-                violation = 3 # Accident
-            else: # Valid move!
-                heading = (-heading[1], heading[0])
-
-        # Agent wants to perform no action:
-        elif action == None:
-            if light == 'green' and inputs['oncoming'] != 'left': # No oncoming traffic
-                violation = 1 # Minor violation
-
+            if agent.primary_agent:
+                penalty = self.deadline_penalty(self.t, state.deadline)
+            elif agent in self.learners:
+                penalty = self.deadline_penalty(self.t - self.learners[agent]['start_t'], state.deadline)
 
         # Did the agent attempt a valid move?
         if violation == 0:
@@ -342,26 +720,18 @@ class Environment(object):
 
             # Move the agent
             if action is not None:
-                location = ((location[0] + heading[0] - self.bounds[0]) % (self.bounds[2] - self.bounds[0] + 1) + self.bounds[0],
-                            (location[1] + heading[1] - self.bounds[1]) % (self.bounds[3] - self.bounds[1] + 1) + self.bounds[1])  # wrap-around
-                state['location'] = location
-                state['heading'] = heading
+                heading = (heading + self.action_turns[action]) % 4
+                location = self._next_location(location, heading)
+                self._move_agent(agent, state, location, heading)
         # Agent attempted invalid move
         else:
-            if violation == 1: # Minor violation
-                reward += -5
-            elif violation == 2: # Major violation
-                reward += -10
-            elif violation == 3: # Minor accident
-                reward += -20
-            elif violation == 4: # Major accident
-                reward += -40
+            reward += self.violation_rewards[violation]
 
         # Did agent reach the goal after a valid move?
         if agent is self.primary_agent:
-            if state['location'] == state['destination']:
+            if state.location == state.destination:
                 # Did agent get to destination before deadline?
-                if state['deadline'] >= 0:
+                if state.deadline >= 0:
                     self.trial_data['success'] = 1
                 
                 # Stop the trial
@@ -369,30 +739,59 @@ class Environment(object):
                 self.success = True
 
                 if(self.verbose == True): # Debugging
-                    print "Environment.act(): Primary agent has reached destination!"
+                    log.debug("Environment.act(): Primary agent has reached destination!")
 
             if(self.verbose == True): # Debugging
-                print "Environment.act() [POST]: location: {}, heading: {}, action: {}, reward: {}".format(location, heading, action, reward)
+                log.debug("Environment.act() [POST]: location: {}, heading: {}, action: {}, reward: {}".format(location, heading, action, reward))
 
             # Update metrics
             self.step_data['t'] = self.t
             self.step_data['violation'] = violation
             self.step_data['state'] = agent.get_state()
-            self.step_data['deadline'] = state['deadline']
+            self.step_data['deadline'] = state.deadline
             self.step_data['waypoint'] = agent.get_next_waypoint()
             self.step_data['inputs'] = inputs
             self.step_data['light'] = light
             self.step_data['action'] = action
             self.step_data['reward'] = reward
+
+            if self.trace is not None:
+                self.trace.record(self.t, self.step_data['state'], action, violation, reward, state.deadline, location, heading)
             
-            self.trial_data['final_deadline'] = state['deadline'] - 1
+            self.trial_data['final_deadline'] = state.deadline - 1
             self.trial_data['net_reward'] += reward
             self.trial_data['actions'][violation] += 1
 
             if(self.verbose == True): # Debugging
-                print "Environment.act(): Step data: {}".format(self.step_data)
+                log.debug("Environment.act(): Step data: {}".format(self.step_data))
+
+        elif agent in self.learners:
+            trip = self.learners[agent]
+            trip['final_deadline'] = state.deadline - 1
+            trip['net_reward'] += reward
+            trip['actions'][violation] += 1
+
+            # Did the learner reach its destination (before its deadline)?
+            if state.location == state.destination:
+                if state.deadline >= 0:
+                    trip['success'] = 1
+                self.end_trip(agent, self.t + 1 - trip['start_t'])
         return reward
 
+    def deadline_penalty(self, t, deadline):
+        """ Penalty factor from [0, 1] for acting at time 't' with 'deadline'
+            steps left, growing exponentially as the deadline runs out.
+            Computed once per (t, deadline) and shared by all environments. """
+
+        key = (t, deadline)
+        try:
+            return self.deadline_penalties[key]
+        except KeyError:
+            fnc = t * 1.0 / (t + deadline)
+            gradient = 10
+            penalty = self.deadline_penalties[key] = (math.pow(gradient, fnc) - 1) / (gradient - 1)
+            return penalty
+
     def compute_dist(self, a, b):
         """ Compute the Manhattan (L1) distance of a spherical world. """
 
@@ -411,8 +810,12 @@ class Environment(object):
 class Agent(object):
     """Base class for all agents."""
 
-    def __init__(self, env):
+    __slots__ = ('env', 'random', 'state', 'next_waypoint', 'color', 'primary_agent')
+
+    def __init__(self, env, rng=None):
         self.env = env
+        # Each agent draws from its own stream unless one is given
+        self.random = rng if rng is not None else env.stream('agent', len(env.agent_states))
         self.state = None
         self.next_waypoint = None
         self.color = 'white'
@@ -432,33 +835,27 @@ class Agent(object):
 
 
 class DummyAgent(Agent):
+    __slots__ = ()
     color_choices = ['cyan', 'red', 'blue', 'green', 'orange', 'magenta', 'yellow']
 
     def __init__(self, env):
-        super(DummyAgent, self).__init__(env)  # sets self.env = env, state = None, next_waypoint = None, and a default color
-        self.next_waypoint = random.choice(Environment.valid_actions[1:])
-        self.color = random.choice(self.color_choices)
+        super(DummyAgent, self).__init__(env, rng=env.dummy_random)  # sets self.env = env, state = None, next_waypoint = None, and a default color
+        self.next_waypoint = self.random.choice(Environment.valid_actions[1:])
+        self.color = self.random.choice(self.color_choices)
 
     def update(self):
-        """ Update a DummyAgent to move randomly under legal traffic laws. """
+        """ Update a DummyAgent to move randomly under legal traffic laws.
+            Environment.update_agents() advances all dummies at once instead;
+            this is for updating a single dummy on its own. """
 
         inputs = self.env.sense(self)
 
         # Check if the chosen waypoint is safe to move to.
-        action_okay = True
-        if self.next_waypoint == 'right':
-            if inputs['light'] == 'red' and inputs['left'] == 'forward':
-                action_okay = False
-        elif self.next_waypoint == 'forward':
-            if inputs['light'] == 'red':
-                action_okay = False
-        elif self.next_waypoint == 'left':
-            if inputs['light'] == 'red' or (inputs['oncoming'] == 'forward' or inputs['oncoming'] == 'right'):
-                action_okay = False
+        action_okay = self.env.violations[(self.next_waypoint, inputs['light'], inputs['oncoming'], inputs['left'], inputs['right'])] == 0
 
         # Move to the next waypoint and choose a new one.
         action = None
         if action_okay:
             action = self.next_waypoint
-            self.next_waypoint = random.choice(Environment.valid_actions[1:])
-        reward = self.env.act(self, action)
\ No newline at end of file
+            self.next_waypoint = self.random.choice(Environment.valid_actions[1:])
+        reward = self.env.act(self, action, inputs)
\ No newline at end of file
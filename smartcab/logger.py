@@ -0,0 +1,50 @@
+import sys
+import logging
+
+# All simulation diagnostics are emitted on the "smartcab" logger hierarchy.
+# Warnings and errors (eg. a GUI that couldn't be set up) always go to stderr;
+# the per-step INFO and DEBUG output is only shown once set_log_level() is
+# called (or the application configures logging itself), so batch runs pay
+# no terminal I/O cost.
+root = logging.getLogger("smartcab")
+warning_handler = logging.StreamHandler(sys.stderr)
+warning_handler.setLevel(logging.WARNING)
+warning_handler.setFormatter(logging.Formatter("%(message)s"))
+root.addHandler(warning_handler)
+root.setLevel(logging.WARNING)
+
+
+class BelowWarning(logging.Filter):
+    """ Passes the records that warning_handler doesn't already show. """
+
+    def filter(self, record):
+        return record.levelno < logging.WARNING
+
+
+def get_logger(name):
+    """ Returns the diagnostics logger for the module 'name'. """
+
+    return logging.getLogger("smartcab.{}".format(name))
+
+
+def set_log_level(level):
+    """ Enable diagnostics at 'level' (e.g. logging.INFO, "DEBUG") on stdout.
+        Passing None disables the output again. Warnings and errors go to
+        stderr either way. """
+
+    for handler in list(root.handlers):
+        if handler is not warning_handler:
+            root.removeHandler(handler)
+
+    if level is None:
+        root.setLevel(logging.WARNING)
+        return
+
+    if isinstance(level, basestring):
+        level = getattr(logging, level.upper())
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    handler.addFilter(BelowWarning())
+    root.addHandler(handler)
+    root.setLevel(level)
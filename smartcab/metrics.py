@@ -0,0 +1,213 @@
+""" Columnar trial metrics.
+
+Every trial is logged as one row of flat numeric columns, buffered in memory
+and written out in batches, either as CSV or as a binary NumPy .npy file
+holding a structured array (one field per column). read_metrics() loads
+either format as a structured array and export_csv() converts .npy logs to
+CSV. """
+import os
+import csv
+import ast
+import numpy as np
+
+
+# Column name and type of every logged field, in file order
+columns = [
+    ('trial', np.int64),
+    ('testing', np.int8),
+    ('initial_deadline', np.int64),
+    ('final_deadline', np.int64),
+    ('net_reward', np.float64),
+    ('epsilon', np.float64),
+    ('alpha', np.float64),
+    ('actions_0', np.int64),  # legal actions
+    ('actions_1', np.int64),  # minor violations
+    ('actions_2', np.int64),  # major violations
+    ('actions_3', np.int64),  # minor accidents
+    ('actions_4', np.int64),  # major accidents
+    ('steps', np.int64),
+    ('success', np.int8),
+]
+fields = [name for name, dtype in columns]
+dtype = np.dtype(columns)
+
+
+
+def trial_row(trial, trial_data, steps):
+    """ Flatten the environment's 'trial_data' for 'trial' into a metrics row. """
+
+    row = {
+        'trial': trial,
+        'testing': int(trial_data['testing']),
+        'initial_deadline': trial_data['initial_deadline'],
+        'final_deadline': trial_data['final_deadline'],
+        'net_reward': trial_data['net_reward'],
+        'epsilon': trial_data['parameters']['e'],
+        'alpha': trial_data['parameters']['a'],
+        'steps': steps,
+        'success': trial_data['success'],
+    }
+    for violation, count in trial_data['actions'].iteritems():
+        row['actions_{}'.format(violation)] = count
+    return row
+
+
+def npy_header(dtype, rows):
+    """ A version 1.0 .npy header for 'rows' records of 'dtype'. The header is
+        padded to the same size whatever the row count, so that it can be
+        rewritten in place as rows are appended. """
+
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (np.lib.format.dtype_to_descr(dtype), rows)
+    magic = np.lib.format.magic(1, 0)
+    size = (len(magic) + 2 + len(header) - len(str(rows)) + 20 + 1 + 63) // 64 * 64  # room for 20 digits
+    header += " " * (size - len(magic) - 2 - len(header) - 1) + "\n"
+    return magic + np.array([len(header)], dtype='<u2').tostring() + header
+
+
+class MetricsWriter(object):
+    """ Buffered writer of trial metrics rows.
+
+    Rows are collected per column and written every 'buffer_size' trials, and
+    on flush() and close(). 'format' is "csv" or "npy"; by default it follows
+    the extension of 'filename'. 'extra_columns' are (name, type) pairs
+    logged after the standard columns, eg. profiling counters.
+
+    With 'append', an existing log is continued rather than overwritten,
+    keeping only its first 'rows' rows if given (eg. the rows written before
+    a checkpoint that a run resumes from). """
+
+    def __init__(self, filename, format=None, buffer_size=1000, extra_columns=(), append=False, rows=None):
+        if format is None:
+            format = "npy" if filename.endswith(".npy") else "csv"
+        if format not in ("csv", "npy"):
+            raise ValueError("Unknown metrics format: {!r}".format(format))
+
+        self.filename = filename
+        self.format = format
+        self.buffer_size = buffer_size
+        self.dtype = np.dtype(columns + list(extra_columns))
+        self.fields = list(self.dtype.names)
+        self.buffer = {name: [] for name in self.fields}
+        self.buffered = 0
+        self.rows = 0  # rows written to the file
+
+        if append and os.path.exists(filename):
+            self.reopen(rows)
+        else:
+            self.file = open(filename, 'wb')
+            if self.format == "csv":
+                self.writer = csv.writer(self.file)
+                self.writer.writerow(self.fields)
+            else:
+                self.file.write(npy_header(self.dtype, 0))
+
+    def reopen(self, rows=None):
+        """ Open the existing log to append to, keeping its first 'rows' rows
+            (all of them if None). """
+
+        if self.format == "csv":
+            with open(self.filename, 'rb') as f:
+                lines = f.readlines()
+            if not lines or next(csv.reader(lines[:1])) != self.fields:
+                raise ValueError("Can't append to {}: its columns differ".format(self.filename))
+            lines = [line for line in lines[1:] if line.endswith("\n")]  # drop a row cut short by a crash
+            if rows is not None:
+                lines = lines[:rows]
+            self.file = open(self.filename, 'wb')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(self.fields)
+            self.file.writelines(lines)
+            self.rows = len(lines)
+        else:
+            self.file = open(self.filename, 'r+b')
+            np.lib.format.read_magic(self.file)
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(self.file)
+            if dtype != self.dtype or self.file.tell() != len(npy_header(self.dtype, 0)):
+                raise ValueError("Can't append to {}: it isn't a log of the same columns".format(self.filename))
+            self.rows = shape[0] if rows is None else min(rows, shape[0])
+            self.file.truncate(self.file.tell() + self.rows * self.dtype.itemsize)
+            self.file.seek(0)
+            self.file.write(npy_header(self.dtype, self.rows))
+            self.file.seek(0, os.SEEK_END)
+
+    def writerow(self, row):
+        """ Buffer a row, given as a {column: value} dict. """
+
+        for name in self.fields:
+            self.buffer[name].append(row[name])
+        self.buffered += 1
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """ Write the buffered rows to the file. """
+
+        if self.buffered:
+            if self.format == "csv":
+                self.writer.writerows(zip(*[self.buffer[name] for name in self.fields]))
+            else:
+                records = np.empty(self.buffered, dtype=self.dtype)
+                for name in self.fields:
+                    records[name] = self.buffer[name]
+                self.file.write(records.tostring())
+
+                # Keep the header's row count current, so the file is always loadable
+                self.file.seek(0)
+                self.file.write(npy_header(self.dtype, self.rows + self.buffered))
+                self.file.seek(0, os.SEEK_END)
+
+            self.rows += self.buffered
+            self.buffer = {name: [] for name in self.fields}
+            self.buffered = 0
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def read_metrics(filename):
+    """ Load a metrics log (.npy or CSV) as a structured array with one field
+        per column. CSV logs in the older format, with 'parameters' and
+        'actions' dict columns, are flattened on the way in. """
+
+    if filename.endswith(".npy"):
+        return np.load(filename)
+
+    with open(filename, 'rb') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        if header[:len(fields)] == fields:
+            # Any extra columns (eg. profiling counters) are read as floats
+            extra_columns = [(name, np.float64) for name in header[len(fields):]]
+            return np.loadtxt(f, dtype=np.dtype(columns + extra_columns), delimiter=',', ndmin=1)
+
+        # Older format: one repr()'d dict per row for the parameters and actions
+        rows = list(reader)
+        data = np.zeros(len(rows), dtype=dtype)
+        index = {name: i for i, name in enumerate(header)}
+        for name in ('trial', 'initial_deadline', 'final_deadline', 'net_reward', 'success'):
+            data[name] = [float(row[index[name]]) for row in rows]
+        data['testing'] = [row[index['testing']] == 'True' for row in rows]
+        parameters = [ast.literal_eval(row[index['parameters']]) for row in rows]
+        data['epsilon'] = [p['e'] for p in parameters]
+        data['alpha'] = [p['a'] for p in parameters]
+        actions = [ast.literal_eval(row[index['actions']]) for row in rows]
+        for violation in xrange(5):
+            data['actions_{}'.format(violation)] = [a[violation] for a in actions]
+        data['steps'] = data['initial_deadline'] - data['final_deadline']
+        return data
+
+
+def export_csv(filename, csv_filename=None):
+    """ Convert the metrics log 'filename' (eg. a .npy log) to CSV, by default
+        next to it with a .csv extension. Returns the CSV filename. """
+
+    if csv_filename is None:
+        csv_filename = os.path.splitext(filename)[0] + ".csv"
+    data = read_metrics(filename)
+    with open(csv_filename, 'wb') as f:
+        writer = csv.writer(f)
+        writer.writerow(data.dtype.names)
+        writer.writerows(data.tolist())
+    return csv_filename
@@ -1,4 +1,7 @@
-import random
+# Waypoint lookup tables: grid_size -> {(delta x, delta y, heading index): waypoint}
+# Filled in lazily and shared by every planner on a grid of the same size
+waypoint_tables = dict()
+
 
 class RoutePlanner(object):
     """ Complex route planner that is meant for a perpendicular grid network. """
@@ -7,22 +10,37 @@ class RoutePlanner(object):
         self.env = env
         self.agent = agent
         self.destination = None
+        self.random = env.stream('planner', len(env.agent_states))
+        self.waypoints = waypoint_tables.setdefault(tuple(env.grid_size), dict())
 
     def route_to(self, destination=None):
         """ Select the destination if one is provided, otherwise choose a random intersection. """
 
-        self.destination = destination if destination is not None else random.choice(self.env.intersections.keys())
+        self.destination = destination if destination is not None else self.random.choice(self.env.intersection_list)
 
     def next_waypoint(self):
-        """ Creates the next waypoint based on current heading, location,
-            intended destination and L1 distance from destination. """
+        """ Returns the next waypoint based on current heading, location,
+            intended destination and L1 distance from destination.
+            Each (delta, heading) combination is only computed once per grid. """
 
         # Collect global location details
-        bounds = self.env.grid_size
-        location = self.env.agent_states[self.agent]['location']
-        heading = self.env.agent_states[self.agent]['heading']
+        state = self.env.agent_states[self.agent]
+        location = state.location
+        key = (self.destination[0] - location[0], self.destination[1] - location[1], state.heading)
+
+        try:
+            return self.waypoints[key]
+        except KeyError:
+            waypoint = self.compute_waypoint(key[0], key[1], self.env.valid_headings[state.heading])
+            self.waypoints[key] = waypoint
+            return waypoint
 
-        delta_a = (self.destination[0] - location[0], self.destination[1] - location[1])
+    def compute_waypoint(self, delta_x, delta_y, heading):
+        """ Creates the waypoint for a destination ('delta_x', 'delta_y') away
+            from the agent's location, given its current heading. """
+
+        bounds = self.env.grid_size
+        delta_a = (delta_x, delta_y)
         delta_b = (bounds[0] + delta_a[0] if delta_a[0] <= 0 else delta_a[0] - bounds[0], \
                    bounds[1] + delta_a[1] if delta_a[1] <= 0 else delta_a[1] - bounds[1])
 
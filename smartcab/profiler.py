@@ -0,0 +1,86 @@
+""" Per-phase call counters and timers for the simulation hot path.
+
+A Profiler wraps the methods that make up each phase of a step on their
+instances only, so nothing is timed (and nothing costs anything) unless it is
+instrumented. Timings are inclusive: 'sense' and 'act' calls made from
+within 'primary_update' and 'dummy_updates' count towards both. """
+import time
+
+
+# Phases reported by the simulator, in report order
+phases = ['primary_update', 'dummy_updates', 'sense', 'act', 'light_updates', 'planner', 'rendering', 'logging']
+
+
+class Profiler(object):
+    """ Named counters and timers, aggregated per trial and over the run.
+        Only the phases in 'names' are instrumented. """
+
+    def __init__(self, names=phases):
+        self.names = list(names)
+        self.trial = {name: [0, 0.0] for name in self.names}   # name -> [calls, seconds] this trial
+        self.totals = {name: [0, 0.0] for name in self.names}  # name -> [calls, seconds] over the run
+        self.trials = 0
+
+    def instrument(self, obj, method, name):
+        """ Replace obj.method, on this instance only, with a wrapper that
+            counts its calls and time under 'name'. Does nothing if 'name'
+            isn't one of the profiled phases. """
+
+        if name not in self.names:
+            return
+        function = getattr(obj, method)
+        counter = self.trial[name]
+
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                counter[0] += 1
+                counter[1] += time.time() - start
+        setattr(obj, method, wrapper)
+
+    def fields(self, names=None):
+        """ Metrics log columns (name and type) of the counters of 'names',
+            by default every profiled phase. """
+
+        columns = []
+        for name in (self.names if names is None else names):
+            columns += [(name + '_calls', 'i8'), (name + '_seconds', 'f8')]
+        return columns
+
+    def counters(self):
+        """ This trial's counters so far, as a {'<name>_calls': n,
+            '<name>_seconds': s} dict. """
+
+        result = {}
+        for name in self.names:
+            result[name + '_calls'], result[name + '_seconds'] = self.trial[name]
+        return result
+
+    def end_trial(self):
+        """ Add this trial's counters to the run totals, reset them, and return
+            them as counters() does. """
+
+        result = self.counters()
+        for name in self.names:
+            counter = self.trial[name]
+            self.totals[name][0] += counter[0]
+            self.totals[name][1] += counter[1]
+            counter[0], counter[1] = 0, 0.0
+        self.trials += 1
+        return result
+
+    def seconds(self):
+        """ Total seconds per name over the run. """
+
+        return {name: self.totals[name][1] for name in self.names}
+
+    def report(self):
+        """ Table of the run totals, one line per name. """
+
+        lines = ["{:<16} {:>10} {:>10} {:>12}".format("phase", "calls", "seconds", "usec/call")]
+        for name in self.names:
+            calls, seconds = self.totals[name]
+            lines.append("{:<16} {:>10} {:>10.3f} {:>12.2f}".format(name, calls, seconds, seconds * 1e6 / calls if calls else 0.0))
+        return "\n".join(lines)
@@ -0,0 +1,70 @@
+import itertools
+import numpy as np
+
+
+class QTable(object):
+    """ Dense Q-table over a small, enumerable state space.
+
+    Q-values are stored in a (states x actions) NumPy array, with every state
+    tuple mapped to a row once at construction. States only appear in the
+    dict-like view (iteration, 'in', len(), Q[state]) once they have been
+    created, mirroring the dictionary Q-table it replaces. """
+
+    def __init__(self, features, actions, init_qval=0.0):
+        """
+        :param features: list with the possible values of each state feature,
+            in the order they appear in the state tuple
+        :param actions: the possible actions (the table's columns)
+        :param init_qval: initial Q-value of every state-action pair
+        """
+        self.states = list(itertools.product(*features))
+        self.state_ids = {state: i for i, state in enumerate(self.states)}
+        self.actions = list(actions)
+        self.action_ids = {action: i for i, action in enumerate(self.actions)}
+        self.init_qval = init_qval
+
+        self.values = np.full((len(self.states), len(self.actions)), init_qval, dtype=np.float64)
+        self.created = np.zeros(len(self.states), dtype=bool)
+
+    def create(self, state):
+        """ Add 'state' to the table with its Q-values at init_qval. """
+
+        state_id = self.state_ids[state]
+        if not self.created[state_id]:
+            self.created[state_id] = True
+            self.values[state_id] = self.init_qval
+
+    def best_actions(self, state):
+        """ Returns every action with the highest Q-value for 'state'. """
+
+        row = self.values[self.state_ids[state]]
+        return [self.actions[i] for i in np.flatnonzero(row == row.max())]
+
+    def max(self, state):
+        """ Returns the highest Q-value for 'state'. """
+
+        return self.values[self.state_ids[state]].max()
+
+    def get(self, state, action):
+        return self.values[self.state_ids[state], self.action_ids[action]]
+
+    def set(self, state, action, value):
+        self.values[self.state_ids[state], self.action_ids[action]] = value
+
+    def __contains__(self, state):
+        state_id = self.state_ids.get(state)
+        return state_id is not None and self.created[state_id]
+
+    def __len__(self):
+        return int(self.created.sum())
+
+    def __iter__(self):
+        for state_id in np.flatnonzero(self.created):
+            yield self.states[state_id]
+
+    def __getitem__(self, state):
+        """ Returns a copy of the Q-values of 'state' as an {action: value} dict. """
+
+        if state not in self:
+            raise KeyError(state)
+        return dict(zip(self.actions, self.values[self.state_ids[state]].tolist()))
@@ -0,0 +1,19 @@
+import random
+import hashlib
+
+
+def derive_seed(seed, *names):
+    """ Derive the seed of the stream 'names' (eg. "agent", 3) from a run
+        'seed'. Stable across processes and Python versions, unlike hash(). """
+
+    key = ":".join(str(part) for part in (seed,) + names)
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+def stream(seed, *names):
+    """ Returns an independent random.Random for the stream 'names' of the
+        run 'seed', or the global random module if 'seed' is None. """
+
+    if seed is None:
+        return random
+    return random.Random(derive_seed(seed, *names))
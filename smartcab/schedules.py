@@ -0,0 +1,124 @@
+import math
+
+
+class DecaySchedules(object):
+    """ Registry of the decay schedules understood by LearningAgent.
+
+    A decay spec is compiled once, when the agent is created, into a schedule:
+    a callable schedule(value, t, alpha) returning the decayed value for trial
+    't', given the current 'value' and learning rate 'alpha'. Unknown or
+    malformed specs raise a ValueError at compile time. """
+
+    def __init__(self, kind):
+        self.kind = kind     # 'epsilon' or 'alpha', used in error messages
+        self.named = {}      # spec -> schedule
+        self.prefixed = {}   # spec prefix -> factory(parameter string) returning a schedule
+
+    def register(self, name, schedule):
+        """ Register 'schedule' under the exact spec 'name'. """
+
+        self.named[name] = schedule
+
+    def register_prefix(self, prefix, factory):
+        """ Register a parameterized schedule. Specs starting with 'prefix' are
+            compiled with factory(rest of the spec). The longest matching
+            prefix wins, so "inv_sigmoida" takes precedence over "inv_sigmoid". """
+
+        self.prefixed[prefix] = factory
+
+    def compile(self, spec):
+        """ Returns the schedule for 'spec', or None if 'spec' is None (no decay).
+            A number is a linear decay rate. """
+
+        if spec is None:
+            return None
+
+        if isinstance(spec, (int, float)) and not isinstance(spec, bool):
+            return linear(spec)
+
+        if isinstance(spec, basestring):
+            if spec in self.named:
+                return self.named[spec]
+            for prefix in sorted(self.prefixed, key=len, reverse=True):
+                if spec.startswith(prefix):
+                    try:
+                        return self.prefixed[prefix](spec[len(prefix):])
+                    except (ValueError, IndexError):
+                        raise ValueError("Malformed {} decay schedule: {!r}".format(self.kind, spec))
+
+        raise ValueError("Unknown {} decay schedule: {!r}".format(self.kind, spec))
+
+
+def linear(rate):
+    """ Subtract 'rate' every trial. """
+
+    rate = float(rate)
+    return lambda value, t, alpha: value - rate
+
+
+def percentage(param):
+    """ "r99.5": keep 99.5% of the value every trial. """
+
+    r = float(param) / 100.
+    return lambda value, t, alpha: r * value
+
+
+def capped_percentage(param):
+    """ "cr99.5": as "r99.5", but never below 0.001. """
+
+    r = float(param) / 100.
+    return lambda value, t, alpha: max(r * value, 0.001)
+
+
+def exponential(param):
+    """ "ert0.05": e^(-0.05 * t). """
+
+    r = float(param)
+    return lambda value, t, alpha: math.e ** (-r * t)
+
+
+def sigmoid_params(param):
+    """ Parse the k and offset out of "_k0.03o100". """
+
+    k, offset = [float(val) for val in param.split("k")[1].split("o")]
+    return k, offset
+
+
+def inverse_sigmoid(param):
+    """ "inv_sigmoid_k...o...": inverse sigmoid where k controls how quickly it
+        decays and o is the offset of the trial at which it crosses 0.5. """
+
+    k, offset = sigmoid_params(param)
+    return lambda value, t, alpha: 1 - (1 / (1 + math.exp(-k * (t - offset))))
+
+
+def inverse_sigmoid_alpha(param):
+    """ "inv_sigmoida_k...o...": as "inv_sigmoid", with k scaled by alpha. """
+
+    k, offset = sigmoid_params(param)
+    return lambda value, t, alpha: 1 - (1 / (1 + math.exp(-k * alpha * (t - offset))))
+
+
+# Epsilon decay schedules
+epsilon_decays = DecaySchedules('epsilon')
+epsilon_decays.register("a^t", lambda value, t, alpha: alpha ** t)
+epsilon_decays.register("a", lambda value, t, alpha: alpha)
+epsilon_decays.register("a2", lambda value, t, alpha: alpha ** 2)
+epsilon_decays.register("1/t2", lambda value, t, alpha: 1.0 / (t ** 2))
+epsilon_decays.register("1/t", lambda value, t, alpha: 1.0 / t)
+epsilon_decays.register("eat", lambda value, t, alpha: math.e ** (-alpha * t))
+epsilon_decays.register("et", lambda value, t, alpha: math.e ** (-t))
+epsilon_decays.register("cat", lambda value, t, alpha: math.cos(alpha * t))
+epsilon_decays.register_prefix("ert", exponential)
+epsilon_decays.register_prefix("r", percentage)
+epsilon_decays.register_prefix("inv_sigmoid", inverse_sigmoid)
+epsilon_decays.register_prefix("inv_sigmoida", inverse_sigmoid_alpha)
+
+# Alpha decay schedules
+alpha_decays = DecaySchedules('alpha')
+alpha_decays.register("1/t", lambda value, t, alpha: 1.0 / t)
+alpha_decays.register("1/t2", lambda value, t, alpha: 1.0 / (t ** 2))
+alpha_decays.register("1/logt", lambda value, t, alpha: 1.0 / math.log(t + math.e - 1))
+alpha_decays.register("half", lambda value, t, alpha: value / 2.0)
+alpha_decays.register_prefix("r", percentage)
+alpha_decays.register_prefix("cr", capped_percentage)
@@ -9,7 +9,12 @@ import os
 import time
 import random
 import importlib
-import csv
+import logging
+from logger import get_logger, set_log_level
+from metrics import MetricsWriter, trial_row
+from profiler import Profiler
+
+log = get_logger("simulator")
 
 class Simulator(object):
     """Simulates agents in a dynamic smartcab environment.
@@ -34,7 +39,7 @@ class Simulator(object):
         'gray'    : (155, 155, 155)
     }
 
-    def __init__(self, env, size=None, update_delay=2.0, display=True, log_metrics=False, optimized=False):
+    def __init__(self, env, size=None, update_delay=2.0, display=True, log_metrics=False, optimized=False, headless=False, log_level=None, log_filename=None, fps=None, log_format="csv", profile=False):
         self.env = env
         self.size = size if size is not None else ((self.env.grid_size[0] + 1) * self.env.block_size, (self.env.grid_size[1] + 2) * self.env.block_size)
         self.width, self.height = self.size
@@ -51,8 +56,24 @@ class Simulator(object):
         self.current_time = 0.0
         self.last_updated = 0.0
         self.update_delay = update_delay  # duration between each step (in seconds)
-
-        self.display = display
+        self.step_count = 0
+
+        # With 'fps' set, the GUI is redrawn at most 'fps' times per second,
+        # independently of 'update_delay', and only the cells that changed
+        # since the last frame are redrawn and pushed to the display
+        self.fps = fps
+        self.last_rendered = None
+        self.redraw = True  # next frame must be a full redraw
+        self.drawn_lights = dict()  # intersection -> light state on screen
+        self.drawn_agents = dict()  # agent -> (location, heading, destination) on screen
+
+        # Headless mode steps the environment back-to-back with no GUI and no
+        # wall-clock gating; diagnostics are only shown if 'log_level' is set
+        self.headless = headless
+        if log_level is not None:
+            set_log_level(log_level)
+
+        self.display = display and not self.headless
         if self.display:
             try:
                 self.pygame = importlib.import_module('pygame')
@@ -67,21 +88,40 @@ class Simulator(object):
                 self.agent_sprite_size = (32, 32)
                 self.primary_agent_sprite_size = (42, 42)
                 self.agent_circle_radius = 20  # radius of circle, when using simple representation
-                for agent in self.env.agent_states:
-                    if agent.color == 'white':
-                        agent._sprite = self.pygame.transform.smoothscale(self.pygame.image.load(os.path.join("images", "car-{}.png".format(agent.color))), self.primary_agent_sprite_size)
-                    else:
-                        agent._sprite = self.pygame.transform.smoothscale(self.pygame.image.load(os.path.join("images", "car-{}.png".format(agent.color))), self.agent_sprite_size)
-                    agent._sprite_size = (agent._sprite.get_width(), agent._sprite.get_height())
 
-                self.font = self.pygame.font.Font(None, 20)
+                # Sprites for every (color, heading) pair, loaded and rotated once and shared by all agents
+                self.sprites = dict()
+                self.sprite_sizes = dict()
+                for color in set(agent.color for agent in self.env.agent_states):
+                    sprite = self.pygame.transform.smoothscale(self.pygame.image.load(os.path.join("images", "car-{}.png".format(color))),
+                        self.primary_agent_sprite_size if color == 'white' else self.agent_sprite_size)
+                    self.sprite_sizes[color] = (sprite.get_width(), sprite.get_height())
+                    for heading, direction in enumerate(self.env.valid_headings):
+                        self.sprites[(color, heading)] = sprite if direction == (1, 0) else self.pygame.transform.rotate(sprite, 180 if direction[0] == -1 else direction[1] * -90)
+
+                # Fonts and the static map are created once rather than every frame
+                self.fonts = {size: self.pygame.font.Font(None, size) for size in (20, 22, 30, 40, 50)}
+                self.font = self.fonts[20]
+                self.background = self.render_background()
                 self.paused = False
+
+                # Screen area around an intersection that its light and the agents at it can draw to
+                self.cell_margin = 2 * self.agent_circle_radius + self.primary_agent_sprite_size[0] / 2 + 4
+                self.header_rect = self.pygame.rect.Rect(0, 0, self.width, 125)  # status text
+                self.header_cells = [intersection for intersection in self.env.intersections
+                                     if self.cell_rect(intersection).colliderect(self.header_rect)]
             except ImportError as e:
                 self.display = False
-                print "Simulator.__init__(): Unable to import pygame; display disabled.\n{}: {}".format(e.__class__.__name__, e)
+                log.warning("Simulator.__init__(): Unable to import pygame; display disabled.\n{}: {}".format(e.__class__.__name__, e))
             except Exception as e:
                 self.display = False
-                print "Simulator.__init__(): Error initializing GUI objects; display disabled.\n{}: {}".format(e.__class__.__name__, e)
+                log.warning("Simulator.__init__(): Error initializing GUI objects; display disabled.\n{}: {}".format(e.__class__.__name__, e))
+
+        # Per-phase counters and timers, reported after the run and logged per trial;
+        # 'profile' is True for every phase or a list of the phases to time
+        self.profiler = None
+        if profile:
+            self.profiler = Profiler() if profile is True else Profiler(profile)
 
         # Setup metrics to report
         self.log_metrics = log_metrics
@@ -99,24 +139,91 @@ class Simulator(object):
                     self.log_filename = os.path.join("logs", "sim_default-learning.csv")
                     self.table_filename = os.path.join("logs","sim_default-learning.txt")
 
-                self.table_file = open(self.table_filename, 'wb')
             else:
                 self.log_filename = os.path.join("logs", "sim_no-learning.csv")
-            
-            self.log_fields = ['trial', 'testing', 'parameters', 'initial_deadline', 'final_deadline', 'net_reward', 'actions', 'success']
-            self.log_file = open(self.log_filename, 'wb')
-            self.log_writer = csv.DictWriter(self.log_file, fieldnames=self.log_fields)
-            self.log_writer.writeheader()
 
-    def run(self, tolerance=0.05, n_test=0):
+            # An explicit log file (eg. one per sweep trial) overrides the defaults
+            if log_filename is not None:
+                self.log_filename = log_filename
+                self.table_filename = os.path.splitext(log_filename)[0] + ".txt"
+
+            # Trial metrics are buffered and written as flat columns, as CSV or as a binary .npy log
+            if log_format == "npy" and log_filename is None:
+                self.log_filename = os.path.splitext(self.log_filename)[0] + ".npy"
+            self.log_format = log_format
+
+        # Opened by run(), which knows whether it resumes an earlier run's logs
+        self.log_writer = None
+        self.learner_writer = None
+
+        if self.profiler is not None:
+            self.instrument(self.profiler)
+
+    def instrument(self, profiler):
+        """ Time each phase of a step with 'profiler'. """
+
+        a = self.env.primary_agent
+        if hasattr(a, '__dict__'):  # agents with only __slots__ can't have methods wrapped
+            profiler.instrument(a, 'update', 'primary_update')
+        if hasattr(a, 'planner'):
+            profiler.instrument(a.planner, 'next_waypoint', 'planner')
+        profiler.instrument(self.env, 'update_agents', 'dummy_updates')
+        profiler.instrument(self.env, 'sense', 'sense')
+        profiler.instrument(self.env, 'act', 'act')
+        profiler.instrument(self.env, 'update_lights', 'light_updates')
+        profiler.instrument(self, 'render', 'rendering')
+        profiler.instrument(self, 'render_text', 'rendering')
+
+    def open_logs(self, resume=False, counters=None):
+        """ Open the trial logs. When resuming, the logs are appended to,
+            keeping the rows that the checkpoint's 'counters' say had been
+            written when it was saved; otherwise they are overwritten. """
+
+        counters = counters or {}
+        # A trial's row can't time its own write, so logging is only in the report's totals
+        self.log_writer = MetricsWriter(self.log_filename, format=self.log_format,
+                                        extra_columns=self.profiler.fields([name for name in self.profiler.names if name != 'logging'])
+                                                      if self.profiler is not None else (),
+                                        append=resume, rows=counters.get('log_rows'))
+
+        # The trips of any other learners are logged next to it, one row per trip
+        if self.env.learners:
+            base, extension = os.path.splitext(self.log_filename)
+            self.learner_writer = MetricsWriter(base + "-learners" + extension, format=self.log_format,
+                                                extra_columns=[('learner', 'i8')],
+                                                append=resume, rows=counters.get('learner_rows'))
+
+        if self.profiler is not None:
+            self.profiler.instrument(self.log_writer, 'writerow', 'logging')
+
+    def log_counters(self):
+        """ Flush the trial logs and return their row counts, to be saved
+            with a checkpoint so that a resumed run continues them. """
+
+        counters = {}
+        if self.log_writer is not None:
+            self.log_writer.flush()
+            counters['log_rows'] = self.log_writer.rows
+        if self.learner_writer is not None:
+            self.learner_writer.flush()
+            counters['learner_rows'] = self.learner_writer.rows
+        return counters
+
+    def run(self, tolerance=0.05, n_test=0, checkpoint_every=None, checkpoint_filename=None, resume_from=None):
         """ Run a simulation of the environment. 
 
         'tolerance' is the minimum epsilon necessary to begin testing (if enabled)
         'n_test' is the number of testing trials simulated
+        'checkpoint_every' saves the learning agent to 'checkpoint_filename'
+            every N training trials and once training has finished
+        'resume_from' is a checkpoint file to continue from; a checkpoint taken
+            at the end of training goes straight to the testing trials
 
         Note that the minimum number of training trials is always 20. """
 
         self.quit = False
+        self.step_count = 0
+        run_start = time.time()
 
         # Get the primary agent
         a = self.env.primary_agent
@@ -125,6 +232,19 @@ class Simulator(object):
         testing = False
         trial = 1
 
+        if checkpoint_every is not None and checkpoint_filename is None:
+            checkpoint_filename = os.path.join("logs", "checkpoint.npz")
+
+        counters = {}
+        if resume_from is not None:
+            counters = a.load_checkpoint(resume_from)
+            total_trials = counters.get('total_trials', total_trials)
+            trial = counters.get('trial', trial)
+            log.info("Resumed from {} at training trial {}".format(resume_from, trial))
+
+        if self.log_metrics:
+            self.open_logs(resume=resume_from is not None, counters=counters)
+
         while True:
 
             # Flip testing switch
@@ -133,6 +253,8 @@ class Simulator(object):
                     if a.learning:
                         if a.epsilon < tolerance: # assumes epsilon decays to 0
                             testing = True
+                            if checkpoint_filename is not None: # Training finished
+                                a.save_checkpoint(checkpoint_filename, total_trials=total_trials, trial=trial, **self.log_counters())
                             trial = 1
                     else:
                         testing = True
@@ -144,111 +266,171 @@ class Simulator(object):
                     break
 
             # Pretty print to terminal
-            print 
-            print "/-------------------------"
+            log.info("")
+            log.info("/-------------------------")
             if testing:
-                print "| Testing trial {}".format(trial)
+                log.info("| Testing trial {}".format(trial))
             else:
-                print "| Training trial {}".format(trial)
+                log.info("| Training trial {}".format(trial))
 
-            print "\-------------------------"
-            print 
+            log.info("\-------------------------")
+            log.info("")
 
             self.env.reset(testing)
-            self.current_time = 0.0
-            self.last_updated = 0.0
-            self.start_time = time.time()
-            while True:
-                try:
-                    # Update current time
-                    self.current_time = time.time() - self.start_time
-
-                    # Handle GUI events
-                    if self.display:
-                        for event in self.pygame.event.get():
-                            if event.type == self.pygame.QUIT:
-                                self.quit = True
-                            elif event.type == self.pygame.KEYDOWN:
-                                if event.key == 27:  # Esc
-                                    self.quit = True
-                                elif event.unicode == u' ':
-                                    self.paused = True
-
-                        if self.paused:
-                            self.pause()
-
-                    # Update environment
-                    if self.current_time - self.last_updated >= self.update_delay:
-                        self.env.step()
-                        self.last_updated = self.current_time
-                    
-                    # Render text
-                    self.render_text(trial, testing)
-
-                    # Render GUI and sleep
-                    if self.display:
-                        self.render(trial, testing)
-                        self.pygame.time.wait(self.frame_delay)
+            if log.isEnabledFor(logging.INFO):
+                self.render_text(trial, testing)
 
-                except KeyboardInterrupt:
-                    self.quit = True
-                finally:
-                    if self.quit or self.env.done:
-                        break
+            if self.headless:
+                self.run_headless_trial(trial, testing)
+            else:
+                self.run_trial(trial, testing)
 
             if self.quit:
                 break
 
             # Collect metrics from trial
-            if self.log_metrics:
-                self.log_writer.writerow({
-                    'trial': trial,
-                    'testing': self.env.trial_data['testing'],
-                    'parameters': self.env.trial_data['parameters'],
-                    'initial_deadline': self.env.trial_data['initial_deadline'],
-                    'final_deadline': self.env.trial_data['final_deadline'],
-                    'net_reward': self.env.trial_data['net_reward'],
-                    'actions': self.env.trial_data['actions'],
-                    'success': self.env.trial_data['success']
-                })
+            if self.log_metrics or self.profiler is not None:
+                row = trial_row(trial, self.env.trial_data, self.env.t)
+                if self.profiler is not None:
+                    row.update(self.profiler.counters())
+                if self.log_metrics:
+                    self.log_writer.writerow(row)
+                if self.profiler is not None:
+                    self.profiler.end_trial()  # after the write, so that it counts towards the totals
+
+            # Collect metrics from the other learners' trips
+            learners = list(self.env.learners)
+            for agent, trip in self.env.finish_trips():
+                if self.log_metrics:
+                    row = trial_row(trip['trip'], trip, trip['steps'])
+                    row['learner'] = learners.index(agent) + 1
+                    self.learner_writer.writerow(row)
 
             # Trial finished
             if self.env.success == True:
-                print "\nTrial Completed!"
-                print "Agent reached the destination."
+                log.info("\nTrial Completed!")
+                log.info("Agent reached the destination.")
             else:
-                print "\nTrial Aborted!"
-                print "Agent did not reach the destination."
+                log.info("\nTrial Aborted!")
+                log.info("Agent did not reach the destination.")
 
             # Increment
             total_trials = total_trials + 1
             trial = trial + 1
 
+            # Periodic checkpoint of the learning agent
+            if checkpoint_every is not None and not testing and a.learning and (total_trials - 1) % checkpoint_every == 0:
+                a.save_checkpoint(checkpoint_filename, total_trials=total_trials, trial=trial, **self.log_counters())
+
         # Clean up
         if self.log_metrics:
 
             if a.learning:
-                f = self.table_file
-                
-                f.write("/-----------------------------------------\n")
-                f.write("| State-action rewards from Q-Learning\n")
-                f.write("\-----------------------------------------\n\n")
-
-                for state in a.Q:
-                    f.write("{}\n".format(state))
-                    for action, reward in a.Q[state].iteritems():
-                        f.write(" -- {} : {:.2f}\n".format(action, reward))
-                    f.write("\n")  
-                self.table_file.close()
-
-            self.log_file.close()
+                # Written once the run is over, so that a crashed run doesn't lose the last one
+                with open(self.table_filename, 'wb') as f:
+                    f.write("/-----------------------------------------\n")
+                    f.write("| State-action rewards from Q-Learning\n")
+                    f.write("\-----------------------------------------\n\n")
+
+                    for state in a.Q:
+                        f.write("{}\n".format(state))
+                        for action, reward in a.Q[state].iteritems():
+                            f.write(" -- {} : {:.2f}\n".format(action, reward))
+                        f.write("\n")  
+
+            self.log_writer.close()
+            if self.learner_writer is not None:
+                self.learner_writer.close()
 
         print "\nSimulation ended. . . "
 
         # Report final metrics
+        elapsed = time.time() - run_start
+        print "{} steps in {:.2f} seconds ({:.1f} steps/sec)".format(self.step_count, elapsed, self.step_count / elapsed if elapsed > 0 else float('inf'))
+        if self.profiler is not None:
+            print self.profiler.report()
         if self.display:
             self.pygame.display.quit()  # shut down pygame
 
+    def run_trial(self, trial, testing=False):
+        """ Run a single trial, stepping the environment every 'update_delay'
+            seconds and rendering the GUI if it is enabled. """
+
+        self.current_time = 0.0
+        self.last_updated = 0.0
+        self.last_rendered = None
+        self.start_time = time.time()
+        while True:
+            try:
+                # Update current time
+                self.current_time = time.time() - self.start_time
+
+                # Handle GUI events
+                frame_due = self.display and (self.fps is None or self.last_rendered is None or
+                                              self.current_time - self.last_rendered >= 1.0 / self.fps)
+                if frame_due:
+                    for event in self.pygame.event.get():
+                        if event.type == self.pygame.QUIT:
+                            self.quit = True
+                        elif event.type == self.pygame.KEYDOWN:
+                            if event.key == 27:  # Esc
+                                self.quit = True
+                            elif event.unicode == u' ':
+                                self.paused = True
+
+                    if self.paused:
+                        self.pause()
+
+                # Update environment
+                if self.current_time - self.last_updated >= self.update_delay:
+                    self.env.step()
+                    self.step_count += 1
+                    self.last_updated = self.current_time
+
+                    # Render text
+                    if log.isEnabledFor(logging.INFO):
+                        self.render_text(trial, testing)
+
+                # Render GUI and sleep
+                if self.display and self.fps is not None:
+                    # Frames are capped at 'fps'; steps due in between run back-to-back
+                    if frame_due or self.env.done:
+                        self.render(trial, testing)
+                        self.last_rendered = self.current_time
+                    remaining = min(self.update_delay - (time.time() - self.start_time - self.last_updated),
+                                    1.0 / self.fps - (time.time() - self.start_time - self.last_rendered))
+                    if remaining > 0:
+                        time.sleep(remaining)
+                elif self.display:
+                    self.render(trial, testing)
+                    self.pygame.time.wait(self.frame_delay)
+                else:
+                    # Sleep until the next update is due rather than spinning
+                    remaining = self.update_delay - (time.time() - self.start_time - self.last_updated)
+                    if remaining > 0:
+                        time.sleep(remaining)
+
+            except KeyboardInterrupt:
+                self.quit = True
+            finally:
+                if self.quit or self.env.done:
+                    break
+
+    def run_headless_trial(self, trial, testing=False):
+        """ Run a single trial as fast as possible: no GUI, no wall-clock
+            gating, and text rendering only when INFO logging is enabled. """
+
+        render = log.isEnabledFor(logging.INFO)
+        env = self.env
+        try:
+            while not env.done:
+                env.step()
+                self.step_count += 1
+                if render:
+                    self.render_text(trial, testing)
+        except KeyboardInterrupt:
+            self.quit = True
+
     def render_text(self, trial, testing=False):
         """ This is the non-GUI render display of the simulation. 
             Simulated trial data will be rendered in the terminal/command prompt. """
@@ -256,121 +438,254 @@ class Simulator(object):
         status = self.env.step_data
         if status and status['waypoint'] is not None: # Continuing the trial
 
+            log.info("")
+            log.info("/-------------------")
+            log.info("| Step {} Results".format(status['t']))
+            log.info("\-------------------")
+            log.info("")
+
             # Previous State
             if status['state']:
-                print "Agent previous state: {}".format(status['state'])
+                log.info("Agent previous state: {}".format(status['state']))
             else:
-                print "!! Agent state not been updated!"
+                log.info("!! Agent state not been updated!")
 
             # Result
             if status['violation'] == 0: # Legal
                 if status['waypoint'] == status['action']: # Followed waypoint
-                    print "Agent followed the waypoint {}. (rewarded {:.2f})".format(status['action'], status['reward'])
+                    log.info("Agent followed the waypoint {}. (rewarded {:.2f})".format(status['action'], status['reward']))
                 elif status['action'] == None:
                     if status['light'] == 'red': # Stuck at red light
-                        print "Agent properly idled at a red light. (rewarded {:.2f})".format(status['reward'])
+                        log.info("Agent properly idled at a red light. (rewarded {:.2f})".format(status['reward']))
                     else:
-                        print "Agent idled at a green light with oncoming traffic. (rewarded {:.2f})".format(status['reward'])
+                        log.info("Agent idled at a green light with oncoming traffic. (rewarded {:.2f})".format(status['reward']))
                 else: # Did not follow waypoint
-                    print "Agent drove {} instead of {}. (rewarded {:.2f})".format(status['action'], status['waypoint'], status['reward'])
+                    log.info("Agent drove {} instead of {}. (rewarded {:.2f})".format(status['action'], status['waypoint'], status['reward']))
             else: # Illegal
                 if status['violation'] == 1: # Minor violation
-                    print "Agent idled at a green light with no oncoming traffic. (rewarded {:.2f})".format(status['reward'])
+                    log.info("Agent idled at a green light with no oncoming traffic. (rewarded {:.2f})".format(status['reward']))
                 elif status['violation'] == 2: # Major violation
-                    print "Agent attempted driving {} through a red light. (rewarded {:.2f})".format(status['action'], status['reward'])
+                    log.info("Agent attempted driving {} through a red light. (rewarded {:.2f})".format(status['action'], status['reward']))
                 elif status['violation'] == 3: # Minor accident
-                    print "Agent attempted driving {} through traffic and cause a minor accident. (rewarded {:.2f})".format(status['action'], status['reward'])
+                    log.info("Agent attempted driving {} through traffic and cause a minor accident. (rewarded {:.2f})".format(status['action'], status['reward']))
                 elif status['violation'] == 4: # Major accident
-                    print "Agent attempted driving {} through a red light with traffic and cause a major accident. (rewarded {:.2f})".format(status['action'], status['reward'])
+                    log.info("Agent attempted driving {} through a red light with traffic and cause a major accident. (rewarded {:.2f})".format(status['action'], status['reward']))
            
             # Time Remaining
             if self.env.enforce_deadline:
                 time = (status['deadline'] - 1) * 100.0 / (status['t'] + status['deadline'])
-                print "{:.0f}% of time remaining to reach destination.".format(time)
+                log.info("{:.0f}% of time remaining to reach destination.".format(time))
             else:
-                print "Agent not enforced to meet deadline."
+                log.info("Agent not enforced to meet deadline.")
 
         # Starting new trial
         else:
             a = self.env.primary_agent
-            print "Simulating trial. . . "
+            log.info("Simulating trial. . . ")
             if a.learning:
-                print "epsilon = {:.4f}; alpha = {:.4f}".format(a.epsilon, a.alpha)
+                log.info("epsilon = {:.4f}; alpha = {:.4f}".format(a.epsilon, a.alpha))
             else:
-                print "Agent not set to learn."
+                log.info("Agent not set to learn.")
 
                 
-    def render(self, trial, testing=False):
-        """ This is the GUI render display of the simulation. 
-            Supplementary trial data can be found from render_text. """
-        
-        # Reset the screen.
-        self.screen.fill(self.bg_color)
+    def render_background(self):
+        """ Pre-render the static map (boundary, roads and intersections) once
+            to an off-screen surface that render() blits every frame. """
 
-        # Draw elements
-        # * Static elements
+        background = self.pygame.Surface(self.size).convert()
+        background.fill(self.bg_color)
 
         # Boundary
-        self.pygame.draw.rect(self.screen, self.boundary, ((self.env.bounds[0] - self.env.hang)*self.env.block_size, (self.env.bounds[1]-self.env.hang)*self.env.block_size, (self.env.bounds[2] + self.env.hang/3)*self.env.block_size, (self.env.bounds[3] - 1 + self.env.hang/3)*self.env.block_size), 4)
+        self.pygame.draw.rect(background, self.boundary, ((self.env.bounds[0] - self.env.hang)*self.env.block_size, (self.env.bounds[1]-self.env.hang)*self.env.block_size, (self.env.bounds[2] + self.env.hang/3)*self.env.block_size, (self.env.bounds[3] - 1 + self.env.hang/3)*self.env.block_size), 4)
         
         for road in self.env.roads:
             # Road
-            self.pygame.draw.line(self.screen, self.road_color, (road[0][0] * self.env.block_size, road[0][1] * self.env.block_size), (road[1][0] * self.env.block_size, road[1][1] * self.env.block_size), self.road_width)
+            self.pygame.draw.line(background, self.road_color, (road[0][0] * self.env.block_size, road[0][1] * self.env.block_size), (road[1][0] * self.env.block_size, road[1][1] * self.env.block_size), self.road_width)
             # Center line
-            self.pygame.draw.line(self.screen, self.line_color, (road[0][0] * self.env.block_size, road[0][1] * self.env.block_size), (road[1][0] * self.env.block_size, road[1][1] * self.env.block_size), 2)
+            self.pygame.draw.line(background, self.line_color, (road[0][0] * self.env.block_size, road[0][1] * self.env.block_size), (road[1][0] * self.env.block_size, road[1][1] * self.env.block_size), 2)
         
+        for intersection in self.env.intersections:
+            self.pygame.draw.circle(background, self.road_color, (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size), self.road_width/2)
+
+        return background
+
+    def render(self, trial, testing=False):
+        """ This is the GUI render display of the simulation. 
+            Supplementary trial data can be found from render_text. """
+
+        if self.fps is not None and not self.redraw and all(agent.color in self.sprite_sizes for agent in self.env.agent_states):
+            if self.render_dirty(trial, testing):
+                return
+
+        # Reset the screen to the pre-rendered static map
+        self.screen.blit(self.background, (0, 0))
+
+        # Draw elements
+        # * Traffic lights
         for intersection, traffic_light in self.env.intersections.iteritems():
-            self.pygame.draw.circle(self.screen, self.road_color, (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size), self.road_width/2)
-            
-            if traffic_light.state: # North-South is open
-                self.screen.blit(self._ns,
-                    self.pygame.rect.Rect(intersection[0]*self.env.block_size - self.road_width/2, intersection[1]*self.env.block_size - self.road_width/2, intersection[0]*self.env.block_size + self.road_width, intersection[1]*self.env.block_size + self.road_width/2))
-                self.pygame.draw.line(self.screen, self.stop_color, (intersection[0] * self.env.block_size - self.road_width/2, intersection[1] * self.env.block_size - self.road_width/2), (intersection[0] * self.env.block_size - self.road_width/2, intersection[1] * self.env.block_size + self.road_width/2), 2)
-                self.pygame.draw.line(self.screen, self.stop_color, (intersection[0] * self.env.block_size + self.road_width/2 + 1, intersection[1] * self.env.block_size - self.road_width/2), (intersection[0] * self.env.block_size + self.road_width/2 + 1, intersection[1] * self.env.block_size + self.road_width/2), 2)            
-            else:
-                self.screen.blit(self._ew,
-                    self.pygame.rect.Rect(intersection[0]*self.env.block_size - self.road_width/2, intersection[1]*self.env.block_size - self.road_width/2, intersection[0]*self.env.block_size + self.road_width, intersection[1]*self.env.block_size + self.road_width/2))
-                self.pygame.draw.line(self.screen, self.stop_color, (intersection[0] * self.env.block_size - self.road_width/2, intersection[1] * self.env.block_size - self.road_width/2), (intersection[0] * self.env.block_size + self.road_width/2, intersection[1] * self.env.block_size - self.road_width/2), 2)
-                self.pygame.draw.line(self.screen, self.stop_color, (intersection[0] * self.env.block_size + self.road_width/2, intersection[1] * self.env.block_size + self.road_width/2 + 1), (intersection[0] * self.env.block_size - self.road_width/2, intersection[1] * self.env.block_size + self.road_width/2 + 1), 2)            
-            
+            self.render_light(intersection, traffic_light.state)
+
         # * Dynamic elements
-        self.font = self.pygame.font.Font(None, 20)
         for agent, state in self.env.agent_states.iteritems():
-            # Compute precise agent location here (back from the intersection some)
-            agent_offset = (2 * state['heading'][0] * self.agent_circle_radius + self.agent_circle_radius * state['heading'][1] * 0.5, \
-                            2 * state['heading'][1] * self.agent_circle_radius - self.agent_circle_radius * state['heading'][0] * 0.5)
+            self.render_agent(agent, state)
+            self.render_destination(state)
 
+        self.render_overlays(trial, testing, self.env.agent_states.get(self.env.primary_agent))
 
-            agent_pos = (state['location'][0] * self.env.block_size - agent_offset[0], state['location'][1] * self.env.block_size - agent_offset[1])
-            agent_color = self.colors[agent.color]
+        if self.fps is not None:
+            self.drawn_lights = {intersection: traffic_light.state for intersection, traffic_light in self.env.intersections.iteritems()}
+            self.drawn_agents = {agent: (state.location, state.heading, state.destination) for agent, state in self.env.agent_states.iteritems()}
+            self.redraw = False
 
-            if hasattr(agent, '_sprite') and agent._sprite is not None:
-                # Draw agent sprite (image), properly rotated
-                rotated_sprite = agent._sprite if state['heading'] == (1, 0) else self.pygame.transform.rotate(agent._sprite, 180 if state['heading'][0] == -1 else state['heading'][1] * -90)
-                self.screen.blit(rotated_sprite,
-                    self.pygame.rect.Rect(agent_pos[0] - agent._sprite_size[0] / 2, agent_pos[1] - agent._sprite_size[1] / 2,
-                        agent._sprite_size[0], agent._sprite_size[1]))
+        # Flip buffers
+        self.pygame.display.flip()
+
+    def render_dirty(self, trial, testing=False):
+        """ Incremental GUI render: only the cells whose light changed or whose
+            agents moved since the last frame are redrawn, along with the
+            status text, and only those rectangles are pushed to the display.
+            Returns False, drawing nothing, when so much of the map changed
+            that a full render is cheaper. """
+
+        # Find the cells that changed
+        cells = set()
+        lights = set()
+        drawn_lights = dict()
+        for intersection, traffic_light in self.env.intersections.iteritems():
+            drawn_lights[intersection] = traffic_light.state
+            if self.drawn_lights.get(intersection) != traffic_light.state:
+                lights.add(intersection)
+
+        drawn_agents = dict()
+        items = dict()  # cell -> [(draw order, agent, state, is destination)]
+        for order, (agent, state) in enumerate(self.env.agent_states.iteritems()):
+            drawn = (state.location, state.heading, state.destination)
+            drawn_agents[agent] = drawn
+            previous = self.drawn_agents.pop(agent, None)
+            if previous != drawn:
+                cells.update(cell for cell in (previous or ()) + drawn if cell in self.env.intersections)
+            items.setdefault(state.location, []).append((order, agent, state, False))
+            if state.destination is not None:
+                items.setdefault(state.destination, []).append((order, agent, state, True))
+        for previous in self.drawn_agents.itervalues():  # agents no longer in the environment
+            cells.update(cell for cell in previous if cell in self.env.intersections)
+
+        if 4 * len(cells) + len(lights) > len(self.env.intersections):
+            return False
+
+        # Redraw each dirty area from the static map up, in the same order as
+        # a full render; the status text goes last as it is drawn over the map
+        dirty_rects = []
+        for cell in cells:
+            rect = self.cell_rect(cell)
+            neighbours = [(cell[0] + dx, cell[1] + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+            self.render_area(rect, neighbours, items)
+            dirty_rects.append(rect)
+
+        # A light that changed in an otherwise unchanged cell only needs its
+        # glyph redrawn, which only the agents at that cell can overlap
+        for cell in lights - cells:
+            rect = self.light_rect(cell)
+            self.render_area(rect, [cell], items)
+            dirty_rects.append(rect)
+
+        self.render_area(self.header_rect, self.header_cells, items)
+        self.render_overlays(trial, testing, self.env.agent_states.get(self.env.primary_agent))
+        dirty_rects.append(self.header_rect)
+        self.screen.set_clip(None)
+
+        self.drawn_lights = drawn_lights
+        self.drawn_agents = drawn_agents
+        self.pygame.display.update(dirty_rects)
+        return True
+
+    def render_area(self, rect, cells, items):
+        """ Restore 'rect' to the static map and redraw the lights and agents
+            of 'cells' within it. Leaves the screen clipped to 'rect'. """
+
+        self.screen.set_clip(rect)
+        self.screen.blit(self.background, rect, rect)
+        for cell in cells:
+            if cell in self.env.intersections:
+                self.render_light(cell, self.env.intersections[cell].state)
+        for order, agent, state, is_destination in sorted(item for cell in cells for item in items.get(cell, ())):
+            if is_destination:
+                self.render_destination(state)
             else:
-                # Draw simple agent (circle with a short line segment poking out to indicate heading)
-                self.pygame.draw.circle(self.screen, agent_color, agent_pos, self.agent_circle_radius)
-                self.pygame.draw.line(self.screen, agent_color, agent_pos, state['location'], self.road_width)
-            
+                self.render_agent(agent, state)
+
+    def cell_rect(self, cell):
+        """ Screen area that the light and agents at intersection 'cell' draw to. """
+
+        return self.pygame.rect.Rect(cell[0] * self.env.block_size - self.cell_margin, cell[1] * self.env.block_size - self.cell_margin,
+                                     2 * self.cell_margin, 2 * self.cell_margin)
+
+    def light_rect(self, cell):
+        """ Screen area of the traffic light glyph and stop lines of intersection 'cell'. """
+
+        return self.pygame.rect.Rect(cell[0] * self.env.block_size - self.road_width/2 - 2, cell[1] * self.env.block_size - self.road_width/2 - 2,
+                                     self.road_width + 5, self.road_width + 5)
 
-            if state['destination'] is not None:
-                self.screen.blit(self._logo,
-                    self.pygame.rect.Rect(state['destination'][0] * self.env.block_size - self.road_width/2, \
-                        state['destination'][1]*self.env.block_size - self.road_width/2, \
-                        state['destination'][0]*self.env.block_size + self.road_width/2, \
-                        state['destination'][1]*self.env.block_size + self.road_width/2))
+    def render_light(self, intersection, state):
+        """ Draw the traffic light of 'intersection' in 'state'. """
+
+        if state: # North-South is open
+            self.screen.blit(self._ns,
+                self.pygame.rect.Rect(intersection[0]*self.env.block_size - self.road_width/2, intersection[1]*self.env.block_size - self.road_width/2, intersection[0]*self.env.block_size + self.road_width, intersection[1]*self.env.block_size + self.road_width/2))
+            self.pygame.draw.line(self.screen, self.stop_color, (intersection[0] * self.env.block_size - self.road_width/2, intersection[1] * self.env.block_size - self.road_width/2), (intersection[0] * self.env.block_size - self.road_width/2, intersection[1] * self.env.block_size + self.road_width/2), 2)
+            self.pygame.draw.line(self.screen, self.stop_color, (intersection[0] * self.env.block_size + self.road_width/2 + 1, intersection[1] * self.env.block_size - self.road_width/2), (intersection[0] * self.env.block_size + self.road_width/2 + 1, intersection[1] * self.env.block_size + self.road_width/2), 2)
+        else:
+            self.screen.blit(self._ew,
+                self.pygame.rect.Rect(intersection[0]*self.env.block_size - self.road_width/2, intersection[1]*self.env.block_size - self.road_width/2, intersection[0]*self.env.block_size + self.road_width, intersection[1]*self.env.block_size + self.road_width/2))
+            self.pygame.draw.line(self.screen, self.stop_color, (intersection[0] * self.env.block_size - self.road_width/2, intersection[1] * self.env.block_size - self.road_width/2), (intersection[0] * self.env.block_size + self.road_width/2, intersection[1] * self.env.block_size - self.road_width/2), 2)
+            self.pygame.draw.line(self.screen, self.stop_color, (intersection[0] * self.env.block_size + self.road_width/2, intersection[1] * self.env.block_size + self.road_width/2 + 1), (intersection[0] * self.env.block_size - self.road_width/2, intersection[1] * self.env.block_size + self.road_width/2 + 1), 2)
+
+    def render_agent(self, agent, state):
+        """ Draw 'agent' at its location, set back from the intersection some. """
+
+        # Compute precise agent location here (back from the intersection some)
+        direction = self.env.valid_headings[state.heading]
+        agent_offset = (2 * direction[0] * self.agent_circle_radius + self.agent_circle_radius * direction[1] * 0.5, \
+                        2 * direction[1] * self.agent_circle_radius - self.agent_circle_radius * direction[0] * 0.5)
+
+
+        agent_pos = (state.location[0] * self.env.block_size - agent_offset[0], state.location[1] * self.env.block_size - agent_offset[1])
+        agent_color = self.colors[agent.color]
+
+        sprite = self.sprites.get((agent.color, state.heading))
+        if sprite is not None:
+            # Draw the pre-rotated agent sprite (image)
+            sprite_size = self.sprite_sizes[agent.color]
+            self.screen.blit(sprite,
+                self.pygame.rect.Rect(agent_pos[0] - sprite_size[0] / 2, agent_pos[1] - sprite_size[1] / 2,
+                    sprite_size[0], sprite_size[1]))
+        else:
+            # Draw simple agent (circle with a short line segment poking out to indicate heading)
+            self.pygame.draw.circle(self.screen, agent_color, agent_pos, self.agent_circle_radius)
+            self.pygame.draw.line(self.screen, agent_color, agent_pos, state.location, self.road_width)
+
+    def render_destination(self, state):
+        """ Draw the destination marker of an agent, if it has one. """
+
+        if state.destination is not None:
+            self.screen.blit(self._logo,
+                self.pygame.rect.Rect(state.destination[0] * self.env.block_size - self.road_width/2, \
+                    state.destination[1]*self.env.block_size - self.road_width/2, \
+                    state.destination[0]*self.env.block_size + self.road_width/2, \
+                    state.destination[1]*self.env.block_size + self.road_width/2))
+
+    def render_overlays(self, trial, testing, state):
+        """ Draw the trial and step status text. 'state' is the primary
+            agent's state, which the success banner is judged on. """
 
         # * Overlays
-        self.font = self.pygame.font.Font(None, 50)
+        self.font = self.fonts[50]
         if testing:
             self.screen.blit(self.font.render("Testing Trial %s"%(trial), True, self.colors['black'], self.bg_color), (10, 10))
         else:
             self.screen.blit(self.font.render("Training Trial %s"%(trial), True, self.colors['black'], self.bg_color), (10, 10))
 
-        self.font = self.pygame.font.Font(None, 30)
+        self.font = self.fonts[30]
 
         # Status text about each step
         status = self.env.step_data
@@ -423,37 +738,33 @@ class Simulator(object):
                 self.screen.blit(self.font.render("Agent not enforced to meet deadline.", True, self.colors['black'], self.bg_color), (350, 100))
             
             # Denote whether a trial was a success or failure
-            if (state['destination'] != state['location'] and state['deadline'] > 0) or (self.env.enforce_deadline is not True and state['destination'] != state['location']):
-                self.font = self.pygame.font.Font(None, 40)
+            if (state.destination != state.location and state.deadline > 0) or (self.env.enforce_deadline is not True and state.destination != state.location):
+                self.font = self.fonts[40]
                 if self.env.success == True:
                     self.screen.blit(self.font.render("Previous Trial: Success", True, self.colors['dgreen'], self.bg_color), (10, 50))
                 if self.env.success == False:
                     self.screen.blit(self.font.render("Previous Trial: Failure", True, self.colors['maroon'], self.bg_color), (10, 50))
 
                 if self.env.primary_agent.learning:
-                    self.font = self.pygame.font.Font(None, 22)
+                    self.font = self.fonts[22]
                     self.screen.blit(self.font.render("epsilon = {:.4f}".format(self.env.primary_agent.epsilon), True, self.colors['black'], self.bg_color), (10, 80))
                     self.screen.blit(self.font.render("alpha = {:.4f}".format(self.env.primary_agent.alpha), True, self.colors['black'], self.bg_color), (10, 95))
 
         # Reset status text
         else:
             self.pygame.rect.Rect(350, 10, self.width, 200)
-            self.font = self.pygame.font.Font(None, 40)
+            self.font = self.fonts[40]
             self.screen.blit(self.font.render("Simulating trial. . .", True, self.colors['white'], self.bg_color), (400, 60))
 
-
-        # Flip buffers
-        self.pygame.display.flip()
-
     def pause(self):
         """ When the GUI is enabled, this function will pause the simulation. """
         
         abs_pause_time = time.time()
-        self.font = self.pygame.font.Font(None, 30)
+        self.font = self.fonts[30]
         pause_text = "Simulation Paused. Press any key to continue. . ."
         self.screen.blit(self.font.render(pause_text, True, self.colors['red'], self.bg_color), (400, self.height - 30))
         self.pygame.display.flip()
-        print pause_text
+        log.info(pause_text)
         while self.paused:
             for event in self.pygame.event.get():
                 if event.type == self.pygame.KEYDOWN:
@@ -461,3 +772,4 @@ class Simulator(object):
             self.pygame.time.wait(self.frame_delay)
         self.screen.blit(self.font.render(pause_text, True, self.bg_color, self.bg_color), (400, self.height - 30))
         self.start_time += (time.time() - abs_pause_time)
+        self.redraw = True
@@ -0,0 +1,143 @@
+""" Hyper-parameter sweep driver for the LearningAgent.
+
+Fans simulations out over a multiprocessing pool, writes each run's trial
+log to its own file and grades the testing trials with the safety and
+reliability ratings from visuals.py. Run from the project root with:
+
+    python -m smartcab.sweep [--search random --n-iter 50] [--grid grid.json]
+"""
+import os
+import sys
+import csv
+import json
+import random
+import argparse
+import itertools
+import multiprocessing
+
+import pandas as pd
+
+# visuals.py lives in the project root, next to the 'smartcab' directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import visuals
+
+from environment import Environment
+from agent import LearningAgent
+from simulator import Simulator
+
+
+# Default search space; every key maps to the list of values to try
+default_grid = {
+    'alpha': [0.15, 0.5],
+    'epsilon': [1.0],
+    'edecay': ["inv_sigmoid_k0.03o100", "r99.5", "ert0.05"],
+    'adecay': [None, "cr99.5"],
+    'num_dummies': [100],
+    'grid_size': [(8, 6)],
+}
+
+result_fields = ['run', 'seed', 'alpha', 'epsilon', 'edecay', 'adecay', 'num_dummies', 'grid_size',
+                 'training_trials', 'testing_trials', 'success_rate', 'safety', 'reliability', 'log_file']
+
+
+def grid_search(param_grid):
+    """ Every combination of the values in 'param_grid'. """
+
+    keys = sorted(param_grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*[param_grid[key] for key in keys])]
+
+
+def random_search(param_grid, n_iter, rng=random):
+    """ 'n_iter' configurations with each value drawn at random from 'param_grid'. """
+
+    keys = sorted(param_grid)
+    return [{key: rng.choice(param_grid[key]) for key in keys} for i in xrange(n_iter)]
+
+
+def run_config(config):
+    """ Train and test one configuration and grade its testing trials.
+        Executed inside a worker process. """
+
+    random.seed(config['seed'])  # Anything still using the global generator
+    env = Environment(num_dummies=config['num_dummies'], grid_size=tuple(config['grid_size']), seed=config['seed'])
+    agent = env.create_agent(LearningAgent, learning=True, epsilon=config['epsilon'], alpha=config['alpha'],
+                             edecay=config['edecay'], adecay=config['adecay'])
+    env.set_primary_agent(agent, enforce_deadline=True)
+
+    sim = Simulator(env, display=False, log_metrics=True, headless=True, log_filename=config['log_file'])
+    sim.run(tolerance=config['tolerance'], n_test=config['n_test'])
+
+    result = {key: config[key] for key in result_fields if key in config}
+    result.update(visuals.summarize(visuals.load_trials(config['log_file'])))
+    return result
+
+
+def sweep(configs, log_dir=os.path.join("logs", "sweep"), processes=None, tolerance=0.05, n_test=10, seed=0):
+    """ Run every configuration in 'configs' across a process pool.
+
+    Run i is seeded with seed + i and logs its trials to
+    <log_dir>/run_<i>.csv. The graded results are written to
+    <log_dir>/results.csv and returned as a list of dicts, in run order. """
+
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
+    jobs = []
+    for i, config in enumerate(configs):
+        job = dict(config)
+        job.update({'run': i, 'seed': seed + i, 'tolerance': tolerance, 'n_test': n_test,
+                    'log_file': os.path.join(log_dir, "run_{}.csv".format(i))})
+        jobs.append(job)
+
+    pool = multiprocessing.Pool(processes=processes)  # Defaults to one worker per core
+    try:
+        results = pool.map(run_config, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    with open(os.path.join(log_dir, "results.csv"), 'wb') as f:
+        writer = csv.DictWriter(f, fieldnames=result_fields)
+        writer.writeheader()
+        for result in results:
+            writer.writerow(result)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep LearningAgent hyper-parameters across all cores.")
+    parser.add_argument('--grid', help="JSON file mapping parameter names to lists of values")
+    parser.add_argument('--search', choices=['grid', 'random'], default='grid')
+    parser.add_argument('--n-iter', type=int, default=20, help="number of random search configurations")
+    parser.add_argument('--processes', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--tolerance', type=float, default=0.05)
+    parser.add_argument('--n-test', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--log-dir', default=os.path.join("logs", "sweep"))
+    args = parser.parse_args()
+
+    param_grid = dict(default_grid)
+    if args.grid is not None:
+        with open(args.grid) as f:
+            for key, values in json.load(f).iteritems():
+                # LearningAgent expects decay specs as str, not unicode
+                param_grid[str(key)] = [str(value) if isinstance(value, unicode) else value for value in values]
+
+    if args.search == 'grid':
+        configs = grid_search(param_grid)
+    else:
+        configs = random_search(param_grid, args.n_iter, random.Random(args.seed))
+
+    results = sweep(configs, log_dir=args.log_dir, processes=args.processes,
+                    tolerance=args.tolerance, n_test=args.n_test, seed=args.seed)
+
+    # Best ratings first ("A+" sorts after "A" alphabetically, so rank explicitly)
+    ratings = {rating: rank for rank, rating in enumerate(["A+", "A", "B", "C", "D", "F"])}
+    table = pd.DataFrame(results, columns=result_fields).drop(['log_file'], axis=1)
+    table['rank'] = table['safety'].map(ratings).fillna(len(ratings)) + table['reliability'].map(ratings).fillna(len(ratings))
+    print table.sort_values(['rank', 'success_rate'], ascending=[True, False]).drop(['rank'], axis=1).to_string(index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+""" Step-level trace of the primary agent.
+
+A StepTrace preallocates a ring buffer of fixed-width records in a
+memory-mapped .npy file; once full, the oldest steps are overwritten. Attach
+one to an environment to record every step of its primary agent:
+
+    env.trace = StepTrace("logs/trace.npy", capacity=1000000)
+
+and load it afterwards, oldest step first, with read_trace(). """
+import itertools
+import numpy as np
+
+
+# Encodings of the recorded fields: indices into these lists
+actions = [None, 'forward', 'left', 'right']          # Environment.valid_actions
+headings = [(1, 0), (0, -1), (-1, 0), (0, 1)]          # Environment.valid_headings
+states = list(itertools.product(['green', 'red'], actions, actions, actions))  # (light, oncoming, left, waypoint)
+
+action_ids = {action: i for i, action in enumerate(actions)}
+state_ids = {state: i for i, state in enumerate(states)}
+
+dtype = np.dtype([
+    ('step', np.int64),       # sequence number across the whole run; -1 for unused records
+    ('t', np.int32),          # time step within the trial
+    ('state', np.int16),      # index into 'states'; -1 if the state isn't one of them
+    ('action', np.int8),      # index into 'actions'
+    ('violation', np.int8),   # 0 (legal) to 4 (major accident)
+    ('reward', np.float64),
+    ('deadline', np.int32),
+    ('x', np.int16),          # location after the step
+    ('y', np.int16),
+    ('heading', np.int8),     # index into 'headings', after the step
+])
+
+
+class StepTrace(object):
+    """ Ring buffer of the last 'capacity' steps, memory-mapped to 'filename'. """
+
+    def __init__(self, filename, capacity=1000000):
+        self.filename = filename
+        self.capacity = capacity
+        self.records = np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=(capacity,))
+        self.records['step'] = -1
+        self.steps = 0  # steps recorded so far
+
+    def record(self, t, state, action, violation, reward, deadline, location, heading):
+        """ Record one step of the primary agent. 'heading' is an index into 'headings'. """
+
+        self.records[self.steps % self.capacity] = (self.steps, t, state_ids.get(state, -1), action_ids[action], violation,
+                                                     reward, deadline, location[0], location[1], heading)
+        self.steps += 1
+
+    def flush(self):
+        self.records.flush()
+
+    def close(self):
+        self.flush()
+        self.records = None
+
+
+def read_trace(filename):
+    """ Load the steps recorded in the trace 'filename' as a structured array
+        (see 'dtype'), oldest first. """
+
+    records = np.load(filename, mmap_mode='r')
+    records = records[records['step'] >= 0]
+    return records[np.argsort(records['step'], kind='mergesort')]
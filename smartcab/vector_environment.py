@@ -0,0 +1,108 @@
+import numpy as np
+from environment import Environment
+from agent import LearningAgent
+
+
+class VectorEnvironment(object):
+    """ A batch of K independent environments, each with its own primary
+        agent and random number generator, that are reset and stepped in
+        lockstep. Useful for training many LearningAgent configurations in a
+        single process. """
+
+    def __init__(self, agent_params, num_dummies=100, grid_size=(8, 6), enforce_deadline=True,
+                 seed=None, env_class=Environment, agent_class=LearningAgent):
+        """
+        :param agent_params: list of keyword argument dicts, one per environment,
+            passed to agent_class (eg. {'learning': True, 'alpha': 0.5, 'edecay': "r99.5"})
+        :param num_dummies: number of dummy agents in every environment
+        :param grid_size: (columns, rows) of every environment
+        :param enforce_deadline: whether the primary agents must meet their deadline
+        :param seed: base seed; environment i is seeded with seed + i
+            (None leaves every environment on the global random module)
+        :param env_class: Environment class to instantiate
+        :param agent_class: agent class to instantiate as each primary agent
+        """
+        self.envs = []
+        self.agents = []
+        for i, params in enumerate(agent_params):
+            env = env_class(num_dummies=num_dummies, grid_size=grid_size, seed=(seed + i if seed is not None else None))
+            agent = env.create_agent(agent_class, **params)
+            env.set_primary_agent(agent, enforce_deadline=enforce_deadline)
+            self.envs.append(env)
+            self.agents.append(agent)
+
+        self.num_envs = len(self.envs)
+        self.dones = np.zeros(self.num_envs, dtype=bool)
+
+    def reset(self, testing=False):
+        """ Start a new trial in every environment and return the initial
+            states of the primary agents.
+
+        'testing' is either a single flag or one flag per environment. """
+
+        if isinstance(testing, bool):
+            testing = [testing] * self.num_envs
+
+        for env, env_testing in zip(self.envs, testing):
+            env.reset(env_testing)
+        self.dones[:] = False
+        return [agent.state for agent in self.agents]
+
+    def step(self):
+        """ Take one time step in every environment whose trial is still running.
+
+        Returns (states, rewards, dones): the primary agents' states, a float
+        array of the rewards earned on this step (0 for finished environments)
+        and a boolean array of which trials have finished. """
+
+        rewards = np.zeros(self.num_envs)
+        for i, env in enumerate(self.envs):
+            if self.dones[i]:
+                continue
+            env.step()
+            rewards[i] = env.step_data['reward']
+            self.dones[i] = env.done
+
+        return [agent.state for agent in self.agents], rewards, self.dones.copy()
+
+    def run(self, tolerance=0.05, n_test=0):
+        """ Train and test every agent in lockstep, switching each environment
+        to testing on its own once its epsilon drops below 'tolerance' (after
+        the minimum 20 training trials), as in Simulator.run().
+
+        Returns a list with, for each environment, the list of its trial data dicts. """
+
+        results = [list() for env in self.envs]
+        testing = [False] * self.num_envs
+        trial = [1] * self.num_envs
+        total_trials = 1
+
+        while True:
+            # Flip testing switches
+            for i, agent in enumerate(self.agents):
+                if not testing[i] and total_trials > 20: # Must complete minimum 20 training trials
+                    if not agent.learning or agent.epsilon < tolerance: # assumes epsilon decays to 0
+                        testing[i] = True
+                        trial[i] = 1
+
+            # Environments that have completed all their testing trials sit idle
+            active = [not testing[i] or trial[i] <= n_test for i in xrange(self.num_envs)]
+            if not any(active):
+                break
+
+            for i, env in enumerate(self.envs):
+                if active[i]:
+                    env.reset(testing[i])
+            self.dones[:] = [not flag for flag in active]
+            while not self.dones.all():
+                self.step()
+
+            for i, env in enumerate(self.envs):
+                if active[i]:
+                    record = dict(env.trial_data)
+                    record['trial'] = trial[i]
+                    results[i].append(record)
+                    trial[i] += 1
+            total_trials += 1
+
+        return results
@@ -6,34 +6,39 @@ warnings.filterwarnings("ignore", category = UserWarning, module = "matplotlib")
 ###########################################
 #
 # Display inline matplotlib plots with IPython
-from IPython import get_ipython
-get_ipython().run_line_magic('matplotlib', 'inline')
+# (skipped when imported from scripts, eg. the sweep driver)
+try:
+	from IPython import get_ipython
+	if get_ipython() is not None:
+		get_ipython().run_line_magic('matplotlib', 'inline')
+except ImportError:
+	pass
 ###########################################
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import os
-import ast
+from smartcab.metrics import read_metrics
 
 
 def calculate_safety(data):
 	""" Calculates the safety rating of the smartcab during testing. """
 
-	good_ratio = data['good_actions'].sum() * 1.0 / \
+	good_ratio = data['actions_0'].sum() * 1.0 / \
 	(data['initial_deadline'] - data['final_deadline']).sum()
 
 	if good_ratio == 1: # Perfect driving
 		return ("A+", "green")
 	else: # Imperfect driving
-		if data['actions'].apply(lambda x: ast.literal_eval(x)[4]).sum() > 0: # Major accident
+		if data['actions_4'].sum() > 0: # Major accident
 			return ("F", "red")
-		elif data['actions'].apply(lambda x: ast.literal_eval(x)[3]).sum() > 0: # Minor accident
+		elif data['actions_3'].sum() > 0: # Minor accident
 			return ("D", "#EEC700")
-		elif data['actions'].apply(lambda x: ast.literal_eval(x)[2]).sum() > 0: # Major violation
+		elif data['actions_2'].sum() > 0: # Major violation
 			return ("C", "#EEC700")
 		else: # Minor violation
-			minor = data['actions'].apply(lambda x: ast.literal_eval(x)[1]).sum()
+			minor = data['actions_1'].sum()
 			if minor >= len(data)/2: # Minor violation in at least half of the trials
 				return ("B", "green")
 			else:
@@ -60,10 +65,52 @@ def calculate_reliability(data):
 			return ("F", "red")
 
 
+def load_trials(filename):
+	""" Loads a trial log (CSV or binary .npy) as a DataFrame with one numeric
+		column per metric. Logs in the older format, with the parameters and
+		action counts as dict reprs, are flattened by read_metrics(). """
+
+	data = pd.DataFrame(read_metrics(filename))
+	data['testing'] = data['testing'].astype(bool)
+	return data
+
+
+def rolling_metrics(data, window=10):
+	""" Rolling averages over 'window' trials of the reward and of the
+		frequency of each kind of action per step taken, and of the success
+		rate in percent, computed in a single pass. """
+
+	steps = (data['initial_deadline'] - data['final_deadline']).astype(float)
+	metrics = data[['net_reward', 'actions_0', 'actions_1', 'actions_2', 'actions_3', 'actions_4']].div(steps, axis=0)
+	metrics.columns = ['average_reward', 'good', 'minor', 'major', 'minor_acc', 'major_acc']
+	metrics['reliability_rate'] = data['success'] * 100
+	return metrics.rolling(window=window, center=False).mean()
+
+
+def summarize(data):
+	""" Summary of a trial log loaded with load_trials(): trial counts and the
+		testing success rate, safety and reliability ratings (None without
+		testing trials). """
+
+	testing_data = data[data['testing']]
+	summary = {
+		'training_trials': int((~data['testing']).sum()),
+		'testing_trials': len(testing_data),
+		'success_rate': None,
+		'safety': None,
+		'reliability': None,
+	}
+	if len(testing_data) > 0:
+		summary['success_rate'] = testing_data['success'].mean()
+		summary['safety'] = calculate_safety(testing_data)[0]
+		summary['reliability'] = calculate_reliability(testing_data)[0]
+	return summary
+
+
 def plot_trials(csv):
 	""" Plots the data from logged metrics during a simulation."""
 
-	data = pd.read_csv(os.path.join("logs", csv))
+	data = load_trials(os.path.join("logs", csv))
 
 	if len(data) < 10:
 		print "Not enough data collected to create a visualization."
@@ -71,21 +118,7 @@ def plot_trials(csv):
 		return
 	
 	# Create additional features
-	data['average_reward'] = (data['net_reward'] / (data['initial_deadline'] - data['final_deadline'])).rolling(window=10, center=False).mean()
-	data['reliability_rate'] = (data['success']*100).rolling(window=10, center=False).mean()  # compute avg. net reward with window=10
-	data['good_actions'] = data['actions'].apply(lambda x: ast.literal_eval(x)[0])
-	data['good'] = (data['good_actions'] * 1.0 / \
-		(data['initial_deadline'] - data['final_deadline'])).rolling(window=10, center=False).mean()
-	data['minor'] = (data['actions'].apply(lambda x: ast.literal_eval(x)[1]) * 1.0 / \
-		(data['initial_deadline'] - data['final_deadline'])).rolling(window=10, center=False).mean()
-	data['major'] = (data['actions'].apply(lambda x: ast.literal_eval(x)[2]) * 1.0 / \
-		(data['initial_deadline'] - data['final_deadline'])).rolling(window=10, center=False).mean()
-	data['minor_acc'] = (data['actions'].apply(lambda x: ast.literal_eval(x)[3]) * 1.0 / \
-		(data['initial_deadline'] - data['final_deadline'])).rolling(window=10, center=False).mean()
-	data['major_acc'] = (data['actions'].apply(lambda x: ast.literal_eval(x)[4]) * 1.0 / \
-		(data['initial_deadline'] - data['final_deadline'])).rolling(window=10, center=False).mean()
-	data['epsilon'] = data['parameters'].apply(lambda x: ast.literal_eval(x)['e']) 
-	data['alpha'] = data['parameters'].apply(lambda x: ast.literal_eval(x)['a']) 
+	data = data.join(rolling_metrics(data, window=10))
 
 
 	# Create training and testing subsets